@@ -0,0 +1,27 @@
+import re
+import string
+from collections import Counter
+
+
+def normalize_answer(text):
+    # SQuAD-style normalization for exact-match scoring
+    text = text.lower()
+    text = "".join(ch for ch in text if ch not in set(string.punctuation))
+    text = re.sub(r"\b(a|an|the)\b", " ", text)
+    return " ".join(text.split())
+
+
+def exact_match(prediction, reference):
+    return normalize_answer(prediction) == normalize_answer(reference)
+
+
+def token_f1(prediction, reference):
+    # SQuAD-style bag-of-tokens F1, used for answers and summaries alike
+    pred = normalize_answer(prediction).split()
+    ref = normalize_answer(reference).split()
+    common = sum((Counter(pred) & Counter(ref)).values())
+    if not pred or not ref or not common:
+        return float(pred == ref)
+    precision = common / len(pred)
+    recall = common / len(ref)
+    return 2 * precision * recall / (precision + recall)
@@ -1,31 +1,64 @@
-import os
-import subprocess
-import streamlit as st
-from pipeline import process_url, summarization, ask_question
-from retriever import Retriever
+import threading
 
-try:
-    import sentence_transformers
-except ImportError:
-    subprocess.call(['pip', 'install', '-r', 'requirements.txt'])
+import streamlit as st
+from pipeline import IngestJob, stream_answer
+from models import warm_up
+from memory_manager import get_memory_manager
+from result_cache import get_result_cache, get_semantic_cache
+import tracing
 
 # Page setup
 st.set_page_config(page_title="Anime Summarizer Chat", layout="wide")
 st.title("Anime LLM Assistant")
 
+
+# ========== Shared Resources ==========
+@st.cache_resource(show_spinner=False)
+def start_models():
+    # Once per server process: every session shares the registry's models
+    return warm_up()
+
+
+@st.cache_resource(show_spinner=False)
+def ingest_jobs():
+    # url -> IngestJob, shared across sessions so a page is ingested once
+    return {}, threading.Lock()
+
+
+def get_ingest_job(url, restart=False):
+    # A finished job stays in place, so its summary or error stays on screen,
+    # until the user asks for the URL again with "Process URL". The rerun
+    # fetches conditionally, so an unchanged page is not parsed again.
+    jobs, lock = ingest_jobs()
+    with lock:
+        job = jobs.get(url)
+        if job is None or (restart and job.done):
+            job = jobs[url] = IngestJob(url).start()
+    return job
+
+
+start_models()
+# Idle indexes and models are spilled or unloaded between reruns when over budget
+get_memory_manager().enforce()
+
+STATUS_LABELS = {
+    "queued": "Queued...",
+    "scraping": "Scraping page...",
+    "indexing": "Scraped {chunks} chunks, building index...",
+    "summarizing": "Indexed {chunks} chunks, writing summary...",
+    "ready": "Summary ready ({chunks} chunks indexed)",
+    "failed": "Error processing URL: {error}",
+}
+
 # State initialization
 if "page" not in st.session_state:
     st.session_state.page = "url_input"
-if "paragraphs" not in st.session_state:
-    st.session_state.paragraphs = None
-if "summary" not in st.session_state:
-    st.session_state.summary = None
 if "url" not in st.session_state:
     st.session_state.url = ""
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
-if "retriever" not in st.session_state:
-    st.session_state.retriever = None
+if "debug_panel" not in st.session_state:
+    st.session_state.debug_panel = False
 
 # ========== Page 1: URL Input ==========
 def page_url_input():
@@ -34,47 +67,106 @@ def page_url_input():
 
     if st.button("Process URL"):
         if st.session_state.url:
-            with st.spinner("Scraping and summarizing..."):
-                try:
-                    paragraphs = process_url(st.session_state.url)
-                    summary = summarization(paragraphs)
-                    retriever = Retriever(paragraphs)
-
-                    # Save to session state
-                    st.session_state.paragraphs = paragraphs
-                    st.session_state.summary = summary
-                    st.session_state.retriever = retriever
-                    st.session_state.chat_history = []
-                    st.session_state.page = "chat"
-                except Exception as e:
-                    st.error(f"Error processing URL: {e}")
+            # Ingestion runs in the background; the chat page shows its progress
+            get_ingest_job(st.session_state.url, restart=True)
+            st.session_state.chat_history = []
+            st.session_state.page = "chat"
+            st.rerun()
 
 # ========== Page 2: Chat Interface ==========
+def _ingest_stage(job):
+    return job.retriever is not None, job.done
+
+def summary_panel():
+    job = get_ingest_job(st.session_state.url)
+    label = STATUS_LABELS[job.status].format(chunks=job.chunks, error=job.error)
+    if job.status == "failed":
+        st.error(label)
+    elif job.done:
+        st.success(label)
+    else:
+        st.caption(label)
+    text = job.summary_text()
+    if text:
+        st.info(text)
+    if _ingest_stage(job) != st.session_state.get("ingest_stage"):
+        # The index or the summary just finished: rerun the whole page so the
+        # question box appears and polling stops
+        st.rerun()
+
 def page_chat():
+    job = get_ingest_job(st.session_state.url)
     st.header("Anime Summary")
-    st.info(st.session_state.summary)
+    # Re-renders on its own every half second until ingestion finishes
+    st.session_state.ingest_stage = _ingest_stage(job)
+    st.fragment(summary_panel, run_every=None if job.done else 0.5)()
 
     st.divider()
     st.header("Ask a Question")
+    if job.retriever is None:
+        st.caption("Questions open once the page is indexed.")
+        return
     user_input = st.text_input("Ask something about the anime:")
 
+    shown = 0
     if st.button("Ask") and user_input:
+        st.markdown(f"**You:** {user_input}")
         try:
-            response = ask_question(user_input, st.session_state.retriever)
+            response = st.write_stream(stream_answer(user_input, job.retriever))
             st.session_state.chat_history.append((user_input, response))
+            shown = 1
         except Exception as e:
             st.error(f"Error answering question: {e}")
 
-    if st.session_state.chat_history:
+    history = st.session_state.chat_history[:len(st.session_state.chat_history) - shown]
+    if history:
         st.subheader("Chat History")
-        for q, r in reversed(st.session_state.chat_history):
+        for q, r in reversed(history):
             st.markdown(f"**You:** {q}")
             st.markdown(f"**Bot:** {r}")
 
     if st.button("Start Over"):
-        for key in ["summary", "url", "chat_history", "retriever", "paragraphs", "page"]:
-            st.session_state[key] = None
+        st.session_state.url = ""
+        st.session_state.chat_history = []
         st.session_state.page = "url_input"
+        st.rerun()
+
+# ========== Debug Panel ==========
+def debug_panel():
+    # Only shows or hides the panel for this session. Tracing is process-wide
+    # and shared by every session, so it is switched on with ANIME_TRACE=1.
+    if not st.sidebar.checkbox("Debug: show stage timings", key="debug_panel"):
+        return
+
+    st.sidebar.subheader("Stage totals")
+    if not tracing.is_enabled():
+        st.sidebar.caption("Tracing is off; start the app with ANIME_TRACE=1 to record stage timings.")
+    st.sidebar.table([
+        {
+            "stage": name,
+            "count": stats["count"],
+            "wall s": round(stats["wall_seconds"], 3),
+            "cpu s": round(stats["cpu_seconds"], 3),
+            "RSS +MB": round(stats["rss_delta_mb"], 1),
+            "max RSS MB": round(stats["max_rss_mb"], 1),
+        }
+        for name, stats in tracing.summary().items()
+    ])
+    st.sidebar.subheader("Recent spans")
+    st.sidebar.json(tracing.recent_spans(20), expanded=False)
+    st.sidebar.subheader("Memory")
+    usage = get_memory_manager().usage()
+    st.sidebar.caption(f"{usage['used_mb']:.0f} / {usage['budget_mb']:.0f} MB, evictions {usage['evictions']}")
+    st.sidebar.table([
+        {"kind": e["kind"], "name": e["name"], "MB": round(e["mb"], 1), "idle s": round(e["idle_seconds"])}
+        for e in usage["entries"]
+    ])
+    st.sidebar.subheader("Caches")
+    st.sidebar.json({"results": get_result_cache().stats(), "semantic": get_semantic_cache().stats()}, expanded=False)
+    if st.sidebar.button("Clear spans"):
+        tracing.clear()
+
+debug_panel()
 
 # ========== Page Routing ==========
 if st.session_state.page == "url_input":
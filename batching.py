@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BATCH_SIZE = int(os.environ.get("ANIME_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("ANIME_MAX_WAIT_MS", "10"))
+MAX_QUEUE = int(os.environ.get("ANIME_MAX_QUEUE", "256"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    # Coalesces requests that arrive close together into one call of
+    # handler(items) -> results. A batch closes when it reaches max_batch_size
+    # or max_wait_ms after its first item arrived. The handler runs on one
+    # worker thread, so model calls never overlap and the event loop stays
+    # free; a full queue rejects new work instead of growing without bound.
+    def __init__(self, handler, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self.stats = {"requests": 0, "batches": 0, "batched_items": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item, timeout=None):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise QueueFull(f"{self.max_queue} requests already queued")
+        self.stats["requests"] += 1
+        try:
+            # shield: a timed-out caller must not cancel a batch other callers share
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            future.cancel()
+            raise
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that already gave up are dropped before any work is done
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            self.stats["batches"] += 1
+            self.stats["batched_items"] += len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self.handler, [item for item, _ in batch])
+            except Exception as e:
+                self.stats["errors"] += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def report(self):
+        batches = self.stats["batches"]
+        return dict(
+            self.stats,
+            queued=self.queued,
+            mean_batch_size=self.stats["batched_items"] / batches if batches else 0.0,
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.max_wait * 1000,
+        )
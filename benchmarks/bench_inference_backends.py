@@ -0,0 +1,119 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from common import exact_match, peak_rss_mb, token_f1, write_results
+from fixtures import dataset_sections, load_dataset
+
+from models import INFERENCE_BACKENDS
+
+
+def _measure(args, queue):
+    # Runs in a fresh process with ANIME_INFERENCE_BACKEND already set, so the
+    # registry loads this backend and peak RSS belongs to it alone
+    try:
+        from models import get_qa_model, get_qa_tokenizer, get_summarizer
+        from questioning.final_questioner import build_prompt_ids, generate_from_ids
+        from summarization.final_summarizer import MAP_SUMMARY_LENGTH, _summarize_batch
+
+        result = {}
+        rows = load_dataset()[:args.questions]
+        contexts = [text for _, text in dataset_sections(load_dataset())[:args.summaries]]
+
+        rss = peak_rss_mb()
+        start = time.perf_counter()
+        get_qa_model()
+        result["qa_load_seconds"] = time.perf_counter() - start
+        result["qa_rss_mb"] = peak_rss_mb() - rss
+
+        tokenizer = get_qa_tokenizer()
+        prompts = [
+            build_prompt_ids(row["question"], [({"section": row["section"], "text": row["context"]}, 1.0)], tokenizer)
+            for row in rows
+        ]
+        generate_from_ids([prompts[0][0]], prompts[0][1])
+        answers = []
+        start = time.perf_counter()
+        for i in range(0, len(prompts), args.batch_size):
+            batch = prompts[i:i + args.batch_size]
+            answers.extend(generate_from_ids([ids for ids, _ in batch], max(budget for _, budget in batch)))
+        result["qa_seconds_per_question"] = (time.perf_counter() - start) / len(prompts)
+        result["exact_match"] = sum(map(exact_match, answers, [row["answer"] for row in rows])) / len(rows)
+        result["answer_f1"] = sum(map(token_f1, answers, [row["answer"] for row in rows])) / len(rows)
+        result["answers"] = answers
+
+        if args.summaries:
+            rss = peak_rss_mb()
+            start = time.perf_counter()
+            get_summarizer()
+            result["summarizer_load_seconds"] = time.perf_counter() - start
+            result["summarizer_rss_mb"] = peak_rss_mb() - rss
+
+            max_length, min_length = MAP_SUMMARY_LENGTH
+            _summarize_batch(contexts[:1], max_length, min_length)
+            start = time.perf_counter()
+            summaries = _summarize_batch(contexts, max_length, min_length)
+            result["summary_seconds_per_text"] = (time.perf_counter() - start) / len(contexts)
+            result["summaries"] = summaries
+
+        result["peak_rss_mb"] = peak_rss_mb()
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run(args):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    reference = None
+    for backend in args.backends:
+        os.environ["ANIME_INFERENCE_BACKEND"] = backend
+        queue = context.Queue()
+        process = context.Process(target=_measure, args=(args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result["backend"] = backend
+
+        if "error" in result:
+            print(f"{backend:6} skipped ({result['error']})")
+            results.append(result)
+            continue
+
+        # The first backend that ran (torch by default) is the accuracy and speed reference
+        answers = result.pop("answers")
+        summaries = result.pop("summaries", None)
+        if reference is None:
+            reference = {"result": result, "answers": answers, "summaries": summaries}
+        base = reference["result"]
+        result["answer_agreement"] = sum(a == b for a, b in zip(answers, reference["answers"])) / len(answers)
+        result["qa_speedup"] = base["qa_seconds_per_question"] / result["qa_seconds_per_question"]
+        if summaries is not None and reference["summaries"] is not None:
+            result["summary_f1_vs_reference"] = (
+                sum(map(token_f1, summaries, reference["summaries"])) / len(summaries)
+            )
+            result["summary_speedup"] = base["summary_seconds_per_text"] / result["summary_seconds_per_text"]
+        results.append(result)
+
+        line = (f"{backend:6} QA {result['qa_seconds_per_question'] * 1000:8.1f} ms/q (x{result['qa_speedup']:.2f})  "
+                f"EM {result['exact_match']:.1%} F1 {result['answer_f1']:.1%}  "
+                f"agree {result['answer_agreement']:.1%}  QA RSS +{result['qa_rss_mb']:.0f} MB")
+        if "summary_speedup" in result:
+            line += (f"  | summary {result['summary_seconds_per_text']:.2f} s (x{result['summary_speedup']:.2f})  "
+                     f"F1 vs ref {result['summary_f1_vs_reference']:.1%}  RSS +{result['summarizer_rss_mb']:.0f} MB")
+        print(line)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare generation inference backends on qa_dataset.csv.")
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS))
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--summaries", type=int, default=16, help="Dataset contexts to summarize (0 to skip)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    write_results("inference_backends", run(args), output=args.output)
@@ -0,0 +1,87 @@
+import argparse
+import json
+import multiprocessing
+import time
+import tracemalloc
+
+from common import peak_rss_mb, write_results
+from fixtures import dataset_sections, load_dataset, load_fixtures, synthetic_page
+
+from scraping.final_scraper import PARSER_BACKENDS, parse_fandom_html
+
+FIXTURE_URL = "https://naruto.fandom.com/wiki/Naruto_Uzumaki"
+
+
+def _measure(backend, html, repeat, queue):
+    # Runs in a fresh process so peak RSS belongs to this backend alone
+    try:
+        baseline_rss = peak_rss_mb()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            data = parse_fandom_html(html, FIXTURE_URL, parser=backend)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        parse_fandom_html(html, FIXTURE_URL, parser=backend)
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rss = peak_rss_mb()
+        queue.put({
+            "seconds_per_page": elapsed / repeat,
+            "pages_per_second": repeat / elapsed,
+            "mb_per_second": len(html.encode("utf-8")) * repeat / elapsed / (1024 * 1024),
+            "python_peak_mb": python_peak / (1024 * 1024),
+            "rss_growth_mb": rss - baseline_rss if rss is not None else None,
+            "output": json.dumps({"chunks": data["chunks"], "links": data["links"], "title": data["title"]}),
+        })
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def parser_fixtures():
+    # Inline scripts and styles, and block elements nested in paragraphs, are
+    # where text extraction differs between parsers. Backends are expected
+    # to match on the first and to differ on the second.
+    sections = dataset_sections(load_dataset())[:10]
+    return load_fixtures() + [
+        ("synthetic-scripts", synthetic_page("Naruto Uzumaki", sections, inline_scripts=True)),
+        ("synthetic-nested-blocks", synthetic_page("Naruto Uzumaki", sections, nested_blocks=True)),
+    ]
+
+
+def run(backends, repeat):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name, html in parser_fixtures():
+        reference = None
+        for backend in backends:
+            queue = context.Queue()
+            process = context.Process(target=_measure, args=(backend, html, repeat, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+
+            output = result.pop("output", None)
+            if output is not None:
+                reference = reference or output
+                result["identical"] = output == reference
+            result.update({"fixture": name, "backend": backend, "bytes": len(html.encode("utf-8"))})
+            results.append(result)
+
+            if "error" in result:
+                print(f"{name:24} {backend:12} skipped ({result['error']})")
+            else:
+                print(f"{name:24} {backend:12} {result['pages_per_second']:8.1f} pages/s "
+                      f"{result['mb_per_second']:7.2f} MB/s  py-peak {result['python_peak_mb']:6.1f} MB  "
+                      f"identical={result['identical']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare HTML parser backends on saved Fandom pages.")
+    parser.add_argument("--backends", nargs="+", default=list(PARSER_BACKENDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    write_results("parsers", run(args.backends, args.repeat), output=args.output)
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import re
+import statistics
+
+# Fixtures and the QA dataset are local; model weights must already be in the
+# Hugging Face cache so nothing in a run touches the network
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from common import exact_match, timed, write_results
+from fixtures import load_dataset, load_fixtures
+
+import tracing
+from embeddings import embed_chunks
+from models import get_embedder, get_qa_tokenizer, get_summarizer
+from questioning.final_questioner import generate_from_ids, raw_ask_question, raw_ask_questions
+from retriever import Retriever
+from scraping.chunking import CHUNK_OVERLAP, CHUNK_TOKENS, chunk_sections
+from scraping.final_scraper import parse_fandom_html
+from summarization.final_summarizer import summarize_chunks
+
+FIXTURE_URL = "https://naruto.fandom.com/wiki/Naruto_Uzumaki"
+
+
+# A chunk belongs to a dataset context when most of its word 4-grams occur
+# in it; parsed pages keep link and reference text the dataset dropped, so
+# exact substring matching misses most true hits
+SHINGLE_SIZE = 4
+MATCH_THRESHOLD = 0.5
+
+
+def _shingles(text, n=SHINGLE_SIZE):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def relevant_chunks(chunks, rows, threshold=MATCH_THRESHOLD):
+    # For each dataset row, the indices of chunks cut from that row's context
+    chunk_shingles = [_shingles(chunk["text"]) for chunk in chunks]
+    by_context = {}
+    for row in rows:
+        if row["context"] not in by_context:
+            context = _shingles(row["context"])
+            by_context[row["context"]] = {
+                i for i, shingles in enumerate(chunk_shingles)
+                if shingles and len(shingles & context) / len(shingles) >= threshold
+            }
+    return [by_context[row["context"]] for row in rows]
+
+
+def recall_at_k(retrieved, relevant, k):
+    # Fraction of questions with at least one chunk of the gold context in the top k
+    scored = [bool(set(ids[:k]) & gold) for ids, gold in zip(retrieved, relevant)]
+    return sum(scored) / len(scored) if scored else None
+
+
+def _stats(timings, count=1):
+    per_item = [t / count for t in timings]
+    return {"mean_seconds": statistics.mean(per_item), "min_seconds": min(per_item), "runs": len(per_item)}
+
+
+def warm_up_models():
+    # Weight loading is reported by model_load spans, not by the stage timings
+    get_embedder()
+    get_summarizer()
+    tokenizer = get_qa_tokenizer()
+    generate_from_ids([[tokenizer.eos_token_id]], 5)
+    return tokenizer
+
+
+def bench_fixture(name, html, rows, args):
+    result = {"fixture": name, "bytes": len(html.encode("utf-8")), "stages": {}}
+    stages = result["stages"]
+
+    data, timings = timed(parse_fandom_html, html, FIXTURE_URL, repeat=args.repeat)
+    stages["parse"] = _stats(timings)
+
+    chunks, timings = timed(chunk_sections, data["chunks"], max_tokens=args.max_tokens, overlap=args.overlap)
+    stages["chunk"] = _stats(timings)
+    result["sections"] = len(data["chunks"])
+    result["chunks"] = len(chunks)
+    result["tokens"] = sum(chunk["token_count"] for chunk in chunks)
+
+    embedded, timings = timed(embed_chunks, chunks, use_cache=False, repeat=args.repeat)
+    stages["embed"] = _stats(timings, len(chunks))
+
+    if not args.skip_summary:
+        _, timings = timed(summarize_chunks, embedded)
+        stages["summarize"] = _stats(timings)
+
+    retriever, timings = timed(Retriever, embedded)
+    stages["index_build"] = _stats(timings)
+
+    # Only questions whose gold context made it onto this page can be scored
+    relevant = relevant_chunks(retriever.chunks, rows)
+    pairs = [(row, gold) for row, gold in zip(rows, relevant) if gold][:args.questions]
+    result["questions"] = len(pairs)
+    if not pairs:
+        return result
+    questions = [row["question"] for row, _ in pairs]
+    golds = [gold for _, gold in pairs]
+    positions = {id(chunk): i for i, chunk in enumerate(retriever.chunks)}
+    top_k = max(args.top_k)
+
+    hits, timings = timed(lambda: [retriever.query(q, top_k=top_k) for q in questions])
+    stages["query"] = _stats(timings, len(questions))
+    stages["query"]["batch_size"] = 1
+    for batch_size in args.batch_sizes:
+        _, timings = timed(lambda: [
+            retriever.query_many(questions[i:i + batch_size], top_k=top_k)
+            for i in range(0, len(questions), batch_size)
+        ])
+        stages[f"query_batch{batch_size}"] = _stats(timings, len(questions))
+        stages[f"query_batch{batch_size}"]["batch_size"] = batch_size
+
+    retrieved = [[positions[id(chunk)] for chunk in chunk_hits] for chunk_hits in hits]
+    result["recall"] = {f"@{k}": recall_at_k(retrieved, golds, k) for k in args.top_k}
+
+    if not args.skip_answer:
+        answered = pairs[:args.answer_questions]
+        questions = [row["question"] for row, _ in answered]
+        references = [row["answer"] for row, _ in answered]
+        result["exact_match"] = {}
+
+        answers, timings = timed(lambda: [raw_ask_question(q, retriever) for q in questions])
+        stages["answer"] = _stats(timings, len(questions))
+        stages["answer"]["batch_size"] = 1
+        result["exact_match"]["batch1"] = sum(map(exact_match, answers, references)) / len(answers)
+        for batch_size in args.batch_sizes:
+            answers, timings = timed(raw_ask_questions, questions, retriever, batch_size=batch_size)
+            stages[f"answer_batch{batch_size}"] = _stats(timings, len(questions))
+            stages[f"answer_batch{batch_size}"]["batch_size"] = batch_size
+            result["exact_match"][f"batch{batch_size}"] = sum(map(exact_match, answers, references)) / len(answers)
+
+    return result
+
+
+def report(result):
+    print(f"\n{result['fixture']}: {result['sections']} sections, {result['chunks']} chunks, "
+          f"{result['tokens']} tokens, {result['questions']} scored questions")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:18} {stats['mean_seconds'] * 1000:10.2f} ms")
+    if "recall" in result:
+        print("  recall " + "  ".join(f"{k} {v:.1%}" for k, v in result["recall"].items()))
+    if "exact_match" in result:
+        print("  EM     " + "  ".join(f"{k} {v:.1%}" for k, v in result["exact_match"].items()))
+
+
+def compare(results, baseline_path):
+    # Stage-by-stage ratio against an earlier bench_pipeline results file
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["fixture"]: r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (ratio < 1 is faster):")
+    for result in results:
+        old = baseline.get(result["fixture"])
+        if old is None:
+            continue
+        for stage, stats in result["stages"].items():
+            if stage in old["stages"]:
+                ratio = stats["mean_seconds"] / old["stages"][stage]["mean_seconds"]
+                print(f"  {result['fixture']:20} {stage:18} x{ratio:6.2f}")
+
+
+def run(args):
+    rows = load_dataset()
+    warm_up_models()
+    results = []
+    for name, html in load_fixtures():
+        if args.fixtures and name not in args.fixtures:
+            continue
+        tracing.clear()
+        result = bench_fixture(name, html, rows, args)
+        if tracing.is_enabled():
+            result["trace"] = tracing.summary()
+        results.append(result)
+        report(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline per-stage timings, retrieval recall@k and answer EM.")
+    parser.add_argument("--fixtures", nargs="*", default=None, help="Fixture names to run (default: all)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8, 32])
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3, 5])
+    parser.add_argument("--questions", type=int, default=200, help="Questions per fixture for retrieval")
+    parser.add_argument("--answer-questions", type=int, default=32, help="Questions per fixture for answering")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-summary", action="store_true")
+    parser.add_argument("--skip-answer", action="store_true")
+    parser.add_argument("--trace", action="store_true", help="Include per-span totals from tracing")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.enable()
+    results = run(args)
+    write_results("pipeline", results, output=args.output)
+    if args.baseline:
+        compare(results, args.baseline)
@@ -0,0 +1,120 @@
+import argparse
+import re
+import time
+
+import numpy as np
+
+from bench_pipeline import FIXTURE_URL, recall_at_k, relevant_chunks
+from common import write_results
+from fixtures import load_dataset, load_fixtures
+
+from embeddings import EmbeddedChunks, embed_chunks
+from retriever import Retriever
+from scraping.chunking import chunk_sections
+from scraping.final_scraper import parse_fandom_html
+
+CONFIGS = {
+    "dense": {"mode": "dense"},
+    "hybrid-rrf": {"mode": "hybrid", "fusion": "rrf"},
+    "hybrid-linear": {"mode": "hybrid", "fusion": "linear"},
+    "hybrid-dense": {"mode": "hybrid", "fusion": "dense"},
+}
+
+
+def distractors(rows, relevant, count, words, seed=0):
+    # Distinct documents cut from dataset sections that are not on the page:
+    # each is a run of consecutive sentences from a random off-page section.
+    # None repeats page text, so the only gold chunks are the page's own.
+    rng = np.random.default_rng(seed)
+    sections = list({row["context"]: row["section"] for row, gold in zip(rows, relevant) if not gold}.items())
+    sentences = [(section, re.split(r"(?<=[.!?])\s+", context)) for context, section in sections]
+    docs = []
+    seen = set()
+    for _ in range(count * 10):
+        if len(docs) >= count:
+            break
+        section, parts = sentences[rng.integers(len(sentences))]
+        start = int(rng.integers(len(parts)))
+        # Lengths vary around the page's mean chunk length
+        target = words * rng.uniform(0.5, 1.5)
+        text = []
+        for sentence in parts[start:]:
+            text.append(sentence)
+            if sum(len(t.split()) for t in text) >= target:
+                break
+        text = " ".join(text)
+        if text not in seen:
+            seen.add(text)
+            docs.append({"section": section, "text": text})
+    return docs
+
+
+def scaled(embedded, scale, rows, relevant):
+    # The page plus (scale - 1) times as many distinct off-page documents, to
+    # stand in for a large wiki; page chunks keep their positions
+    if scale == 1:
+        return embedded
+    words = int(np.mean([len(chunk["text"].split()) for chunk in embedded.chunks]))
+    extra = embed_chunks(distractors(rows, relevant, (scale - 1) * len(embedded), words))
+    if len(extra) < (scale - 1) * len(embedded):
+        print(f"x{scale}: only {len(extra)} distinct distractors available")
+    return EmbeddedChunks(
+        embedded.chunks + extra.chunks,
+        np.concatenate([embedded.embeddings, extra.embeddings]),
+        model_name=embedded.model_name,
+    )
+
+
+def run(args):
+    rows = load_dataset()
+    fixtures = dict(load_fixtures())
+    html = fixtures[args.fixture]
+    chunks = chunk_sections(parse_fandom_html(html, FIXTURE_URL)["chunks"])
+    embedded = embed_chunks(chunks)
+
+    relevant = relevant_chunks(embedded.chunks, rows)
+    pairs = [(row, gold) for row, gold in zip(rows, relevant) if gold][:args.questions]
+    questions = [row["question"] for row, _ in pairs]
+    golds = [gold for _, gold in pairs]
+    print(f"{args.fixture}: {len(embedded)} chunks, {len(questions)} scored questions")
+
+    results = []
+    for scale in args.scales:
+        corpus = scaled(embedded, scale, rows, relevant)
+        for name in args.configs:
+            retriever = Retriever(corpus, candidates=args.candidates, **CONFIGS[name])
+            index, lexical, _ = retriever._resident()
+            embeddings = retriever.encode_queries(questions)
+
+            # Search only: query encoding costs the same in every configuration
+            retriever._search(index, lexical, questions[:1], embeddings[:1], max(args.top_k))
+            start = time.perf_counter()
+            _, indices = retriever._search(index, lexical, questions, embeddings, max(args.top_k))
+            elapsed = time.perf_counter() - start
+
+            retrieved = [[int(i) for i in row if i >= 0] for row in indices]
+            result = {
+                "config": name,
+                "scale": scale,
+                "chunks": len(corpus),
+                "ms_per_query": elapsed / len(questions) * 1000,
+                "recall": {f"@{k}": recall_at_k(retrieved, golds, k) for k in args.top_k},
+            }
+            results.append(result)
+            print(f"x{scale:<4} {len(corpus):8} chunks  {name:14} {result['ms_per_query']:8.3f} ms/query  "
+                  + "  ".join(f"R{k} {v:.1%}" for k, v in result["recall"].items()))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense-only and BM25-prefiltered hybrid retrieval.")
+    parser.add_argument("--fixture", default="synthetic-large")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 50],
+                        help="Corpus size as a multiple of the page, padded with distinct off-page documents")
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3, 5])
+    parser.add_argument("--candidates", type=int, default=100, help="BM25 candidates reranked densely")
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    write_results("retrieval", run(args), output=args.output)
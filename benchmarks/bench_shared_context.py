@@ -0,0 +1,84 @@
+import argparse
+import time
+from collections import OrderedDict
+
+from common import exact_match, write_results
+from fixtures import load_dataset
+
+from models import get_qa_tokenizer
+from questioning.final_questioner import (
+    MAX_INPUT_TOKENS,
+    _question_ids,
+    build_prompt_ids,
+    generate_from_ids,
+    generate_with_shared_prefix,
+    pack_context_ids,
+)
+
+
+def workloads(num_contexts, questions_per_context):
+    # One context per section, asked its own dataset question plus follow-ups
+    # taken from other rows of the same section
+    by_section = OrderedDict()
+    for row in load_dataset():
+        by_section.setdefault(row["section"], []).append(row)
+
+    for section, rows in list(by_section.items())[:num_contexts]:
+        anchor = rows[0]
+        questions = [(row["question"], row["answer"] if row is anchor else None) for row in rows[:questions_per_context]]
+        yield {"section": section, "text": anchor["context"]}, questions
+
+
+def run(num_contexts, questions_per_context):
+    tokenizer = get_qa_tokenizer()
+    generate_from_ids([[tokenizer.eos_token_id]], 5)  # load weights outside the timings
+
+    totals = {"serial": 0.0, "batched": 0.0, "shared": 0.0}
+    answers = {"serial": [], "batched": [], "shared": []}
+    golds = []
+    count = 0
+
+    for chunk, questions in workloads(num_contexts, questions_per_context):
+        hits = [(chunk, 1.0)]
+        prompts = [build_prompt_ids(q, hits, tokenizer) for q, _ in questions]
+        golds.extend(gold for _, gold in questions)
+        count += len(questions)
+
+        start = time.perf_counter()
+        for input_ids, budget in prompts:
+            answers["serial"].extend(generate_from_ids([input_ids], budget))
+        totals["serial"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers["batched"].extend(generate_from_ids([ids for ids, _ in prompts], max(b for _, b in prompts)))
+        totals["batched"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        suffixes = [_question_ids(q, tokenizer) for q, _ in questions]
+        longest = max(len(ids) for ids in suffixes)
+        context = pack_context_ids(hits, tokenizer, MAX_INPUT_TOKENS - longest)
+        budget = min(200, int((len(context) + longest) * 0.5) + 20)
+        answers["shared"].extend(generate_with_shared_prefix(context, suffixes, max_length=budget, do_sample=False))
+        totals["shared"] += time.perf_counter() - start
+
+    results = {"questions": count, "contexts": num_contexts, "modes": {}}
+    for mode in totals:
+        scored = [exact_match(a, g) for a, g in zip(answers[mode], golds) if g is not None]
+        results["modes"][mode] = {
+            "seconds_per_question": totals[mode] / count,
+            "agreement_with_serial": sum(a == b for a, b in zip(answers[mode], answers["serial"])) / count,
+            "exact_match": sum(scored) / len(scored) if scored else None,
+        }
+        r = results["modes"][mode]
+        print(f"{mode:8} {r['seconds_per_question'] * 1000:8.1f} ms/question  "
+              f"agreement {r['agreement_with_serial']:.1%}  EM {r['exact_match']:.1%}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare shared-context answering with full-prompt answering.")
+    parser.add_argument("--contexts", type=int, default=20)
+    parser.add_argument("--questions-per-context", type=int, default=4)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    write_results("shared_context", run(args.contexts, args.questions_per_context), output=args.output)
@@ -0,0 +1,111 @@
+import argparse
+import csv
+import html
+import os
+import re
+
+from common import project_root
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+QA_DATASET = os.path.join(project_root, "questioning", "questions creation", "data", "qa_dataset.csv")
+DEFAULT_FIXTURE_URLS = [
+    "https://naruto.fandom.com/wiki/Naruto_Uzumaki",
+    "https://naruto.fandom.com/wiki/Hinata_Hyūga",
+]
+# Number of dataset sections per synthetic page
+FIXTURE_SIZES = {"small": 10, "medium": 50, "large": 200}
+
+
+def fixture_name(url):
+    return re.sub(r"[^\w.-]+", "_", url.rstrip("/").rsplit("/", 1)[-1]) + ".html"
+
+
+def save_fixture(url, fixture_dir=FIXTURE_DIR):
+    from scraping.fetcher import fetch_page
+
+    page = fetch_page(url, use_cache=False)
+    os.makedirs(fixture_dir, exist_ok=True)
+    path = os.path.join(fixture_dir, fixture_name(url))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<!-- source: {url} -->\n")
+        f.write(page["html"])
+    return path
+
+
+def load_dataset(path=QA_DATASET):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def dataset_sections(rows):
+    # Unique (section, context) pairs in dataset order
+    seen = set()
+    sections = []
+    for row in rows:
+        key = (row["section"], row["context"])
+        if key not in seen:
+            seen.add(key)
+            sections.append(key)
+    return sections
+
+
+def synthetic_page(title, sections, inline_scripts=False, nested_blocks=False):
+    # Fandom-like markup: infobox, nested inline tags, references and wiki
+    # links; inline_scripts adds the script, style and template elements
+    # Fandom embeds in article text, which no parser may count as text;
+    # nested_blocks puts a <div> inside paragraphs, invalid markup that
+    # parsers repair differently
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>", html.escape(title), "</title></head><body>",
+        "<h1 class=\"page-header__title\"> ", html.escape(title), " </h1>",
+        "<div class=\"mw-content-text\"><div class=\"mw-parser-output\">",
+        "<aside class=\"portable-infobox\"><h2>", html.escape(title), "</h2><div>Infobox</div></aside>",
+    ]
+    for i, (section, text) in enumerate(sections):
+        tag = "h3" if i % 3 == 2 else "h2"
+        parts.append(f"<{tag}><span class=\"mw-headline\" id=\"s{i}\">{html.escape(section)}</span>"
+                     f"<span class=\"mw-editsection\">[]</span></{tag}>")
+        sentences = re.split(r"(?<=\.)\s+", text)
+        for j in range(0, len(sentences), 3):
+            body = " ".join(html.escape(s) for s in sentences[j:j + 3])
+            if nested_blocks:
+                body = f"{body}<div class=\"quote\">{html.escape(section)}</div>{html.escape(section)}"
+            if inline_scripts:
+                body = (f"{body}<script>window.ads = window.ads || []; ads.push({j});</script>"
+                        f"<style>.ad-{j} {{ display: none; }}</style><template><b>Ad {j}</b></template>")
+            parts.append(
+                f"<p>{body} <a href=\"/wiki/Page_{i}_{j}\" title=\"Page\">link</a>"
+                f"<sup class=\"reference\"><a href=\"#cite_note-{j}\">[{j}]</a></sup>\n</p>"
+            )
+        parts.append("<figure><a href=\"/wiki/File:Image.png\"><img src=\"x.png\"></a></figure>")
+    parts.append("</div></div></body></html>")
+    return "".join(parts)
+
+
+def synthetic_fixtures(sizes=FIXTURE_SIZES):
+    sections = dataset_sections(load_dataset())
+    return [
+        (f"synthetic-{name}", synthetic_page("Naruto Uzumaki", sections[:count]))
+        for name, count in sizes.items()
+    ]
+
+
+def load_fixtures(fixture_dir=FIXTURE_DIR, include_synthetic=True):
+    # Saved pages from fixture_dir plus synthetic pages built from qa_dataset.csv
+    fixtures = []
+    if os.path.isdir(fixture_dir):
+        for name in sorted(os.listdir(fixture_dir)):
+            if name.endswith(".html"):
+                with open(os.path.join(fixture_dir, name), encoding="utf-8") as f:
+                    fixtures.append((name[:-len(".html")], f.read()))
+    if include_synthetic:
+        fixtures.extend(synthetic_fixtures())
+    return fixtures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save Fandom pages as offline benchmark fixtures.")
+    parser.add_argument("urls", nargs="*", default=DEFAULT_FIXTURE_URLS)
+    args = parser.parse_args()
+    for url in args.urls:
+        print(f"Saved {url} -> {save_fixture(url)}")
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from bench_pipeline import FIXTURE_URL
+from common import write_results
+from fixtures import load_dataset, load_fixtures
+
+import aiohttp
+from aiohttp import web
+
+from embeddings import embed_chunks
+from pipeline import IngestJob
+from retriever import Retriever
+from scraping.chunking import chunk_sections
+from scraping.final_scraper import parse_fandom_html
+from service import REQUEST_TIMEOUT, JobStore, create_app
+
+
+def ready_jobs(fixture):
+    # A job indexed from a saved fixture, so the load test never touches the network
+    html = dict(load_fixtures())[fixture]
+    job = IngestJob(FIXTURE_URL)
+    embedded = embed_chunks(chunk_sections(parse_fandom_html(html, FIXTURE_URL)["chunks"]))
+    job.retriever = Retriever(embedded)
+    job.chunks = len(embedded)
+    job.summary = ""
+    job.status = "ready"
+    jobs = JobStore()
+    jobs.jobs[FIXTURE_URL] = job
+    return jobs
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+async def _load(base_url, questions, concurrency, timeout):
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(session, question):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.post(f"{base_url}/ask", json={"url": FIXTURE_URL, "question": question, "timeout": timeout}) as r:
+                await r.read()
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+                if r.status == 200:
+                    latencies.append(time.perf_counter() - start)
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session, q) for q in questions))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def run_config(jobs, questions, concurrency, max_batch_size, max_wait_ms, max_queue, timeout):
+    app = create_app(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, max_queue=max_queue,
+                     use_cache=False, jobs=jobs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        latencies, statuses, elapsed = await _load(f"http://127.0.0.1:{port}", questions, concurrency, timeout)
+        report = app["batcher"].report()
+    finally:
+        await runner.cleanup()
+
+    return {
+        "concurrency": concurrency,
+        "max_batch_size": max_batch_size,
+        "max_wait_ms": max_wait_ms,
+        "requests": len(questions),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "throughput_rps": statuses.get(200, 0) / elapsed,
+        "latency_p50_ms": (_percentile(latencies, 0.5) or 0) * 1000,
+        "latency_p95_ms": (_percentile(latencies, 0.95) or 0) * 1000,
+        "latency_p99_ms": (_percentile(latencies, 0.99) or 0) * 1000,
+        "latency_mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+        "mean_batch_size": report["mean_batch_size"],
+    }
+
+
+def run(args):
+    jobs = ready_jobs(args.fixture)
+    rows = load_dataset()
+    questions = [row["question"] for row in rows[:args.requests]]
+    results = []
+    for concurrency in args.concurrency:
+        # max batch size 1 is the unbatched baseline: one generation call per request
+        for max_batch_size in (1, args.max_batch_size):
+            result = asyncio.run(run_config(
+                jobs, questions, concurrency, max_batch_size, args.max_wait_ms, args.max_queue, args.timeout
+            ))
+            results.append(result)
+            print(f"c={concurrency:<4} batch<={max_batch_size:<3} {result['throughput_rps']:7.2f} req/s  "
+                  f"p50 {result['latency_p50_ms']:8.1f} ms  p95 {result['latency_p95_ms']:8.1f} ms  "
+                  f"mean batch {result['mean_batch_size']:5.2f}  statuses {result['statuses']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the question endpoint with and without micro-batching.")
+    parser.add_argument("--fixture", default="synthetic-medium")
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32, 64])
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--max-queue", type=int, default=256)
+    # The service refuses timeouts over its REQUEST_TIMEOUT (ANIME_REQUEST_TIMEOUT)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    write_results("service_load", run(args), output=args.output)
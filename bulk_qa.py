@@ -0,0 +1,284 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from answer_metrics import exact_match
+from corpus_index import get_corpus_index
+from memory_manager import get_memory_manager
+from pipeline import embed, process_url
+from questioning.final_questioner import raw_ask_questions
+from retriever import Retriever
+from tracing import span
+
+BATCH_SIZE = 16
+GROUP_WINDOW = 2048
+MAX_RESIDENT_PAGES = 8
+TOP_K = 3
+
+
+def _has_question(row, question_field):
+    return str(row.get(question_field) or "").strip() != ""
+
+
+def read_items(path, question_field="question"):
+    # Streams input rows that have a question as dicts tagged with their line
+    # number; .csv is read with a header row, anything else as JSON lines
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            if question_field not in (reader.fieldnames or []):
+                raise ValueError(f"{path} has no '{question_field}' column")
+            for line, row in enumerate(reader, start=1):
+                if _has_question(row, question_field):
+                    yield line, row
+            return
+        for line, text in enumerate(f, start=1):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                print(f"Skipping line {line}: not valid JSON")
+                continue
+            if isinstance(row, dict) and _has_question(row, question_field):
+                yield line, row
+
+
+def item_id(line, row, question, id_field="id"):
+    # Stable across reruns of the same input, which is what resuming relies on
+    if row.get(id_field) not in (None, ""):
+        return str(row[id_field])
+    return hashlib.sha256(f"{line}\0{question}".encode("utf-8")).hexdigest()[:16]
+
+
+def page_key(row, default_url=None, default_wiki=None, use_context=False):
+    # What a question is answered over: a page URL, a wiki in the shared
+    # corpus, the whole corpus, or (for datasets such as qa_dataset.csv)
+    # the row's own context passage
+    if use_context and row.get("context"):
+        return ("context", None)
+    if row.get("url") or default_url:
+        return ("url", row.get("url") or default_url)
+    if row.get("wiki") or default_wiki:
+        return ("wiki", row.get("wiki") or default_wiki)
+    return ("corpus", None)
+
+
+class PageRetrievers:
+    # Ingests and indexes each page once, keeping the most recent ones
+    # resident; pages are registered with the memory manager like the app's
+    def __init__(self, max_resident=MAX_RESIDENT_PAGES):
+        self.max_resident = max_resident
+        self._retrievers = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (retriever, seconds spent ingesting, 0 when already resident)
+        kind, name = key
+        if kind == "context":
+            return None, 0.0
+        if kind == "wiki":
+            return get_corpus_index().retriever(wiki=name), 0.0
+        if kind == "corpus":
+            return get_corpus_index().retriever(), 0.0
+
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            with self._lock:
+                retriever = self._retrievers.get(name)
+                if retriever is not None:
+                    self._retrievers.move_to_end(name)
+                    return retriever, 0.0
+            start = time.perf_counter()
+            with span("bulk_ingest", url=name):
+                retriever = get_memory_manager().track_index(name, Retriever(embed(process_url(name))))
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._retrievers[name] = retriever
+                while len(self._retrievers) > self.max_resident:
+                    self._retrievers.popitem(last=False)
+            return retriever, elapsed
+
+
+class ResultWriter:
+    # Append-only JSONL results. Each batch is written and fsynced as one
+    # block; ids already answered without error are skipped on resume.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.done = set()
+        if os.path.exists(path):
+            self._repair_tail()
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not record.get("error"):
+                        self.done.add(record["id"])
+
+    def _repair_tail(self):
+        # An interrupted write can leave a torn last line; drop it so the
+        # next append starts on a fresh line
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def write(self, records):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.update(record["id"] for record in records if not record.get("error"))
+
+
+def _context_hits(row):
+    return [({"section": row.get("section", ""), "text": row["context"]}, 1.0)]
+
+
+def answer_group(key, items, pages, writer, batch_size=BATCH_SIZE, score=False):
+    # items: (id, question, row) for one page, answered batch_size at a time
+    kind, name = key
+    try:
+        retriever, ingest_seconds = pages.get(key)
+    except Exception as e:
+        writer.write([
+            {"id": item, "question": question, "page": name, "error": f"Ingest failed: {e}"}
+            for item, question, _ in items
+        ])
+        return len(items), 0
+
+    answered = 0
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        questions = [question for _, question, _ in batch]
+        try:
+            t0 = time.perf_counter()
+            if kind == "context":
+                hits = [_context_hits(row) for _, _, row in batch]
+            else:
+                hits = retriever.query_many(questions, top_k=TOP_K, return_scores=True)
+            t1 = time.perf_counter()
+            answers = raw_ask_questions(questions, retriever, batch_size=len(batch), hits=hits)
+            t2 = time.perf_counter()
+        except Exception as e:
+            # Recorded as errors, so a rerun retries this batch and the rest of the run goes on
+            writer.write([
+                {"id": item, "question": question, "page": name, "error": f"Answering failed: {e}"}
+                for item, question, _ in batch
+            ])
+            answered += len(batch)
+            continue
+
+        records = []
+        for (item, question, row), answer, item_hits in zip(batch, answers, hits):
+            record = {
+                "id": item,
+                "question": question,
+                "page": name,
+                "answer": answer,
+                "sections": [chunk.get("section") for chunk, _ in item_hits],
+                "batch_size": len(batch),
+                "ingest_ms": ingest_seconds * 1000 if start == 0 else 0.0,
+                "retrieve_ms": (t1 - t0) * 1000 / len(batch),
+                "generate_ms": (t2 - t1) * 1000 / len(batch),
+            }
+            if answer.startswith("Error:"):
+                record["error"] = answer
+            if row.get("answer"):
+                record["reference"] = row["answer"]
+                if score:
+                    record["exact_match"] = exact_match(answer, row["answer"])
+            records.append(record)
+        writer.write(records)
+        answered += len(records)
+    return answered, ingest_seconds
+
+
+def _windows(items, size):
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def run(input_path, output_path, url=None, wiki=None, use_context=False, batch_size=BATCH_SIZE, workers=2,
+        group_window=GROUP_WINDOW, question_field="question", id_field="id", score=False):
+    writer = ResultWriter(output_path)
+    pages = PageRetrievers()
+    totals = {"answered": 0, "skipped": 0, "pages": 0}
+    start = time.perf_counter()
+
+    # Input is read one window at a time and grouped by page within it, so a
+    # page's questions share one ingest and fill whole generation batches
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-qa") as pool:
+        for window in _windows(read_items(input_path, question_field), group_window):
+            groups = OrderedDict()
+            for line, row in window:
+                question = str(row[question_field]).strip()
+                item = item_id(line, row, question, id_field)
+                if item in writer.done:
+                    totals["skipped"] += 1
+                    continue
+                key = page_key(row, url, wiki, use_context)
+                groups.setdefault(key, []).append((item, question, row))
+
+            futures = [
+                pool.submit(answer_group, key, items, pages, writer, batch_size, score)
+                for key, items in groups.items()
+            ]
+            for future in futures:
+                answered, _ = future.result()
+                totals["answered"] += answered
+            totals["pages"] += len(groups)
+            elapsed = time.perf_counter() - start
+            print(f"{totals['answered']} answered, {totals['skipped']} skipped "
+                  f"({totals['answered'] / elapsed:.2f} questions/s)")
+
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL or CSV file of questions, resumably.")
+    parser.add_argument("input", help="JSONL or CSV with a question column and optionally url, wiki or context")
+    parser.add_argument("output", help="JSONL results; rerunning with the same file resumes")
+    parser.add_argument("--url", default=None, help="Page for rows without a url")
+    parser.add_argument("--wiki", default=None, help="Answer rows without a url over this wiki in the corpus index")
+    parser.add_argument("--use-context", action="store_true",
+                        help="Answer from each row's own context column (e.g. qa_dataset.csv)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--group-window", type=int, default=GROUP_WINDOW, help="Rows read ahead and grouped by page")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--score", action="store_true", help="Add exact_match against a reference answer column")
+    args = parser.parse_args()
+
+    try:
+        totals = run(
+            args.input, args.output, url=args.url, wiki=args.wiki, use_context=args.use_context,
+            batch_size=args.batch_size, workers=args.workers, group_window=args.group_window,
+            question_field=args.question_field, id_field=args.id_field, score=args.score,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Done: {totals['answered']} answered, {totals['skipped']} already done, "
+          f"{totals['pages']} page groups in {totals['seconds']:.1f}s")
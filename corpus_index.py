@@ -0,0 +1,450 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from embedding_cache import CACHE_DIR
+from embeddings import EmbeddedChunks, embed_chunks
+from models import EMBEDDING_MODEL, get_embedder, in_use
+from result_cache import content_fingerprint, make_key
+from tracing import span
+from vector_index import SCORE_BLOCK_ROWS, normalize_rows, top_k_rows
+
+CORPUS_DIR = os.environ.get("ANIME_CORPUS_DIR", os.path.join(CACHE_DIR, "corpus"))
+# Chunk fields kept in the metadata store; everything else is dropped
+CHUNK_FIELDS = ("section", "parent_section", "text", "window", "start", "end", "token_count", "token_ids")
+# Dead matrix rows are reclaimed once there are at least this many and they
+# make up this fraction of the matrix, so compaction stays rare
+COMPACT_MIN_DEAD_ROWS = 1000
+COMPACT_DEAD_FRACTION = 0.25
+
+
+def wiki_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class _Snapshot:
+    # Immutable view of one committed generation: live row ids in matrix
+    # order, the page each row belongs to, and the memory-mapped matrix.
+    # Row ids only mean something within matrix_file, since compaction
+    # renumbers them when it writes a new file.
+    def __init__(self, generation, rows, page_ids, pages, matrix, matrix_file):
+        self.generation = generation
+        self.rows = rows
+        self.page_ids = page_ids
+        self.pages = pages
+        self.matrix = matrix
+        self.matrix_file = matrix_file
+
+
+class CorpusIndex:
+    # Multi-page index on disk: normalized float32 embeddings in an append-only
+    # matrix file, read through a memory map, and chunk/page metadata in
+    # SQLite. Replacing or deleting a page only rewrites metadata; the dead
+    # matrix rows are reclaimed by compact(). Readers in any number of threads
+    # or processes see whole committed pages only, since rows become visible
+    # when their metadata commits, after the vectors are on disk.
+    def __init__(self, path=CORPUS_DIR, model_name=EMBEDDING_MODEL):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_cache = None
+        self._local = threading.local()
+        # Writer connection; readers get one per thread so they never see a
+        # page another thread has not committed yet
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "page_id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, wiki TEXT NOT NULL, "
+            "title TEXT, fingerprint TEXT NOT NULL, chunks INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, page_id INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_page ON chunks (page_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_wiki ON pages (wiki)")
+        self.maybe_compact()
+
+    # ---------- metadata helpers ----------
+
+    def _connect(self):
+        return sqlite3.connect(
+            os.path.join(self.path, "corpus.sqlite3"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _meta(self, key, default=None, conn=None):
+        row = (conn or self._conn).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _bump_generation(self):
+        self._set_meta("generation", int(self._meta("generation", 0)) + 1)
+
+    def _matrix_file(self, conn=None):
+        return self._meta("matrix_file", "embeddings-0.f32", conn)
+
+    def _matrix_path(self, conn=None):
+        return os.path.join(self.path, self._matrix_file(conn))
+
+    def _check_model(self, dim):
+        stored_model = self._meta("model")
+        if stored_model is None:
+            self._set_meta("model", self.model_name)
+            self._set_meta("dim", dim)
+        elif stored_model != self.model_name or int(self._meta("dim")) != dim:
+            raise ValueError(
+                f"Corpus at {self.path} holds {stored_model} embeddings of dim {self._meta('dim')}, "
+                f"not {self.model_name} of dim {dim}"
+            )
+
+    # ---------- writes ----------
+
+    def add_page(self, url, chunks, title=None, wiki=None):
+        # Adds or replaces one page; returns False when the stored copy is identical
+        fingerprint = content_fingerprint(chunks)
+        row = self._reader().execute("SELECT fingerprint FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is not None and row[0] == fingerprint:
+            return False
+
+        embedded = chunks if isinstance(chunks, EmbeddedChunks) else embed_chunks(chunks, self.model_name)
+        matrix = normalize_rows(embedded.embeddings) if len(embedded) else np.zeros((0, 0), dtype=np.float32)
+        records = [json.dumps({k: chunk[k] for k in CHUNK_FIELDS if k in chunk}) for chunk in embedded.chunks]
+
+        with span("corpus_add", url=url, chunks=len(records)), self._lock:
+            # IMMEDIATE takes SQLite's write lock, which also serializes appends to the matrix file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                page_id = self._replace_page(url, title, wiki or wiki_of(url), fingerprint, len(records))
+                if records:
+                    self._check_model(matrix.shape[1])
+                    start = self._append(matrix)
+                    self._conn.executemany(
+                        "INSERT INTO chunks (row, page_id, data) VALUES (?, ?, ?)",
+                        [(start + i, page_id, record) for i, record in enumerate(records)],
+                    )
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.maybe_compact()
+        return True
+
+    def _replace_page(self, url, title, wiki, fingerprint, count):
+        row = self._conn.execute("SELECT page_id FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM chunks WHERE page_id = ?", (row[0],))
+            self._conn.execute(
+                "UPDATE pages SET title = ?, wiki = ?, fingerprint = ?, chunks = ?, updated = ? WHERE page_id = ?",
+                (title, wiki, fingerprint, count, time.time(), row[0]),
+            )
+            return row[0]
+        return self._conn.execute(
+            "INSERT INTO pages (url, wiki, title, fingerprint, chunks, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, wiki, title, fingerprint, count, time.time()),
+        ).lastrowid
+
+    def _append(self, matrix):
+        row_bytes = matrix.shape[1] * 4
+        with open(self._matrix_path(), "ab") as f:
+            size = f.tell()
+            # A writer that died mid-append can leave a partial row behind
+            if size % row_bytes:
+                f.write(b"\0" * (row_bytes - size % row_bytes))
+                size += row_bytes - size % row_bytes
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return size // row_bytes
+
+    def delete_page(self, url):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT page_id FROM pages WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM chunks WHERE page_id = ?", (row[0],))
+                    self._conn.execute("DELETE FROM pages WHERE page_id = ?", (row[0],))
+                    self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is not None:
+            self.maybe_compact()
+        return row is not None
+
+    def dead_rows(self):
+        # (dead, total) rows in the current matrix file
+        conn = self._reader()
+        dim = int(self._meta("dim", 0, conn))
+        path = self._matrix_path(conn)
+        if not dim or not os.path.exists(path):
+            return 0, 0
+        total = os.path.getsize(path) // (dim * 4)
+        return total - conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0], total
+
+    def maybe_compact(self):
+        dead, total = self.dead_rows()
+        if dead >= COMPACT_MIN_DEAD_ROWS and dead >= COMPACT_DEAD_FRACTION * total:
+            self.compact()
+            return True
+        return False
+
+    def compact(self):
+        # Rewrites the matrix without dead rows into a new file, so readers
+        # still mapping the old one are unaffected until they see the commit
+        with span("corpus_compact") as s, self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [r for (r,) in self._conn.execute("SELECT row FROM chunks ORDER BY row")]
+                old_path = self._matrix_path()
+                generation = int(self._meta("generation", 0)) + 1
+                new_name = f"embeddings-{generation}.f32"
+                dim = int(self._meta("dim", 0))
+                if dim and os.path.exists(old_path):
+                    old = np.memmap(old_path, dtype=np.float32, mode="r").reshape(-1, dim)
+                    with open(os.path.join(self.path, new_name), "wb") as f:
+                        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                            f.write(np.ascontiguousarray(old[rows[start:start + SCORE_BLOCK_ROWS]]).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    del old
+                # Ascending order keeps every new row id free when it is assigned
+                self._conn.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?", [(new, old) for new, old in enumerate(rows) if new != old]
+                )
+                self._set_meta("matrix_file", new_name)
+                self._set_meta("generation", generation)
+                self._conn.execute("COMMIT")
+                s.set(rows=len(rows))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        try:
+            os.remove(old_path)
+        except OSError:
+            # Still mapped by a reader on a platform that refuses the delete
+            pass
+
+    # ---------- reads ----------
+
+    def _snapshot(self):
+        conn = self._reader()
+        with self._snapshot_lock:
+            cached = self._snapshot_cache
+            if cached is not None and cached.generation == int(self._meta("generation", 0, conn)):
+                return cached
+            for attempt in range(3):
+                try:
+                    snapshot = self._read_snapshot(conn)
+                    break
+                except FileNotFoundError:
+                    # A compaction committed and removed the matrix file
+                    # before it was mapped; the next read sees its new file
+                    if attempt == 2:
+                        raise
+            self._snapshot_cache = snapshot
+            return snapshot
+
+    def _read_snapshot(self, conn):
+        # One read transaction so pages, rows and matrix file agree. The
+        # matrix is mapped inside it; once mapped, removing the file no
+        # longer affects this snapshot.
+        conn.execute("BEGIN")
+        try:
+            generation = int(self._meta("generation", 0, conn))
+            pages = {
+                page_id: {"url": url, "wiki": wiki, "title": title, "fingerprint": fingerprint}
+                for page_id, url, wiki, title, fingerprint in conn.execute(
+                    "SELECT page_id, url, wiki, title, fingerprint FROM pages"
+                )
+            }
+            live = np.array(conn.execute("SELECT row, page_id FROM chunks ORDER BY row").fetchall(), dtype=np.int64)
+            live = live.reshape(-1, 2)
+            dim = int(self._meta("dim", 0, conn))
+            matrix_file = self._matrix_file(conn)
+            matrix = None
+            # With no live rows there may be no matrix file at all
+            if dim and len(live):
+                matrix = np.memmap(os.path.join(self.path, matrix_file), dtype=np.float32, mode="r")
+                matrix = matrix[:len(matrix) // dim * dim].reshape(-1, dim)
+        finally:
+            conn.execute("COMMIT")
+        return _Snapshot(generation, live[:, 0], live[:, 1], pages, matrix, matrix_file)
+
+    def _select_rows(self, snapshot, urls=None, wiki=None):
+        if urls is None and wiki is None:
+            return snapshot.rows
+        urls = set(urls) if urls is not None else None
+        page_ids = [
+            page_id for page_id, page in snapshot.pages.items()
+            if (urls is None or page["url"] in urls) and (wiki is None or page["wiki"] == wiki)
+        ]
+        return snapshot.rows[np.isin(snapshot.page_ids, page_ids)]
+
+    def search(self, query_embeddings, top_k=3, urls=None, wiki=None, snapshot=None):
+        # Exact cosine top-k over the selected pages, scanning the memory map
+        # block by block so only the selected rows are paged in
+        snapshot = snapshot or self._snapshot()
+        queries = normalize_rows(query_embeddings)
+        rows = self._select_rows(snapshot, urls, wiki)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        if snapshot.matrix is None:
+            return best_scores, best_rows
+
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            # Pages are appended whole, so a filtered block is usually one contiguous slice
+            if block[-1] - block[0] + 1 == len(block):
+                vectors = snapshot.matrix[block[0]:block[-1] + 1]
+            else:
+                vectors = snapshot.matrix[block]
+            scores, indices = top_k_rows(queries @ np.asarray(vectors).T, top_k)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate([best_rows, block[indices]], axis=1)
+            best_scores, order = top_k_rows(scores, top_k)
+            best_rows = np.take_along_axis(candidates, order, axis=1)
+        return best_scores, best_rows
+
+    def chunks_for_rows(self, rows, snapshot=None):
+        # row -> chunk dict, with the page's url and title attached. Rows
+        # found through a snapshot are looked up only if no compaction has
+        # renumbered them since; otherwise returns None and the caller
+        # searches again. Rows whose page was deleted since are left out.
+        rows = [int(r) for r in rows]
+        conn = self._reader()
+        conn.execute("BEGIN")
+        try:
+            if snapshot is not None and self._matrix_file(conn) != snapshot.matrix_file:
+                return None
+            found = {}
+            if rows:
+                placeholders = ",".join("?" * len(rows))
+                for row, data, url, title in conn.execute(
+                    "SELECT c.row, c.data, p.url, p.title FROM chunks c JOIN pages p ON p.page_id = c.page_id "
+                    f"WHERE c.row IN ({placeholders})",
+                    rows,
+                ):
+                    found[row] = dict(json.loads(data), url=url, title=title)
+            return found
+        finally:
+            conn.execute("COMMIT")
+
+    def encode_queries(self, questions):
+        with in_use(self.model_name):
+            return np.asarray(
+                get_embedder(self.model_name).encode(questions, convert_to_numpy=True, normalize_embeddings=True),
+                dtype=np.float32,
+            )
+
+    def query_many(self, questions, top_k=3, return_scores=False, return_embeddings=False, urls=None, wiki=None):
+        questions = list(questions)
+        if not questions:
+            return ([], np.zeros((0, 0), dtype=np.float32)) if return_embeddings else []
+        with span("retrieve", questions=len(questions), top_k=top_k, corpus=True):
+            embeddings = self.encode_queries(questions)
+            chunks = None
+            while chunks is None:
+                snapshot = self._snapshot()
+                scores, rows = self.search(embeddings, top_k, urls=urls, wiki=wiki, snapshot=snapshot)
+                chunks = self.chunks_for_rows(np.unique(rows), snapshot)
+        hits = []
+        for row_scores, row_ids in zip(scores, rows):
+            found = [(chunks[int(r)], float(s)) for s, r in zip(row_scores, row_ids) if int(r) in chunks]
+            hits.append(found if return_scores else [chunk for chunk, _ in found])
+        return (hits, embeddings) if return_embeddings else hits
+
+    def query(self, q, top_k=3, return_scores=False, return_embedding=False, urls=None, wiki=None):
+        hits, embeddings = self.query_many(
+            [q], top_k=top_k, return_scores=return_scores, return_embeddings=True, urls=urls, wiki=wiki
+        )
+        return (hits[0], embeddings[0]) if return_embedding else hits[0]
+
+    def retriever(self, urls=None, wiki=None):
+        return CorpusRetriever(self, urls=urls, wiki=wiki)
+
+    # ---------- introspection ----------
+
+    def pages(self, wiki=None):
+        sql = "SELECT url, wiki, title, chunks, updated FROM pages"
+        params = ()
+        if wiki is not None:
+            sql += " WHERE wiki = ?"
+            params = (wiki,)
+        return [
+            {"url": url, "wiki": w, "title": title, "chunks": chunks, "updated": updated}
+            for url, w, title, chunks, updated in self._reader().execute(sql + " ORDER BY url", params)
+        ]
+
+    def stats(self):
+        snapshot = self._snapshot()
+        matrix_rows = 0 if snapshot.matrix is None else len(snapshot.matrix)
+        return {
+            "pages": len(snapshot.pages),
+            "wikis": len({page["wiki"] for page in snapshot.pages.values()}),
+            "chunks": len(snapshot.rows),
+            "dead_rows": matrix_rows - len(snapshot.rows),
+            "matrix_mb": (0 if snapshot.matrix is None else snapshot.matrix.nbytes) / (1024 * 1024),
+            "generation": snapshot.generation,
+        }
+
+
+class CorpusRetriever:
+    # Retriever-compatible view of a CorpusIndex restricted to some pages or
+    # one wiki, so raw_ask_question and ask_questions can answer over it
+    def __init__(self, corpus, urls=None, wiki=None):
+        self.corpus = corpus
+        self.urls = list(urls) if urls is not None else None
+        self.wiki = wiki
+        # (generation, fingerprint) of the last snapshot it was computed for
+        self._fingerprint = (None, None)
+
+    @property
+    def fingerprint(self):
+        # Changes whenever any selected page is replaced, added or deleted
+        snapshot = self.corpus._snapshot()
+        generation, fingerprint = self._fingerprint
+        if generation != snapshot.generation:
+            urls = set(self.urls) if self.urls is not None else None
+            fingerprint = make_key(sorted(
+                page["fingerprint"] for page in snapshot.pages.values()
+                if (urls is None or page["url"] in urls) and (self.wiki is None or page["wiki"] == self.wiki)
+            ))
+            self._fingerprint = (snapshot.generation, fingerprint)
+        return fingerprint
+
+    def query(self, q, top_k=3, return_scores=False, return_embedding=False):
+        return self.corpus.query(q, top_k, return_scores, return_embedding, urls=self.urls, wiki=self.wiki)
+
+    def query_many(self, questions, top_k=3, return_scores=False, return_embeddings=False):
+        return self.corpus.query_many(questions, top_k, return_scores, return_embeddings, urls=self.urls, wiki=self.wiki)
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus_index():
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = CorpusIndex()
+    return _corpus
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List
+
+import numpy as np
+
+CACHE_DIR = os.environ.get(
+    "ANIME_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+MAX_CACHE_BYTES = int(os.environ.get("ANIME_EMBEDDING_CACHE_MB", "512")) * 1024 * 1024
+
+
+def chunk_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    # Content-addressed store of embedding rows. Every batch of misses is written
+    # as one float32 .npy segment that is memory-mapped on read; a SQLite index
+    # maps chunk keys to (segment, row) and tracks segment sizes for LRU
+    # eviction. The app, the service and bulk runs share one cache directory,
+    # so every index update is a transaction rather than a rewrite of one
+    # process's view.
+    def __init__(self, cache_dir: str = EMBEDDING_CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.sqlite3")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "segment TEXT PRIMARY KEY, bytes INTEGER NOT NULL, rows INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, segment TEXT NOT NULL, row INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment)")
+        self._import_json_index()
+
+    def _import_json_index(self):
+        # Caches written before the SQLite index kept it in index.json
+        json_path = os.path.join(self.cache_dir, "index.json")
+        try:
+            with open(json_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO segments (segment, bytes, rows, last_access) VALUES (?, ?, ?, ?)",
+                [(s, m["bytes"], m["rows"], m["last_access"]) for s, m in index.get("segments", {}).items()],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO entries (key, segment, row) VALUES (?, ?, ?)",
+                [(key, s, row) for key, (s, row) in index.get("entries", {}).items()],
+            )
+        try:
+            os.remove(json_path)
+        except OSError:
+            pass
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes SQLite's write lock up front, so two processes
+        # cannot both decide a key is missing or both evict the same segment
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.cache_dir, f"{segment}.npy")
+
+    def _remove_files(self, segments):
+        for segment in segments:
+            try:
+                os.remove(self._segment_path(segment))
+            except OSError:
+                pass
+
+    def _drop_segments(self, segments):
+        # Inside a transaction; files are removed by the caller after commit
+        self._conn.executemany("DELETE FROM entries WHERE segment = ?", [(s,) for s in segments])
+        self._conn.executemany("DELETE FROM segments WHERE segment = ?", [(s,) for s in segments])
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM segments").fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for segment, size in self._conn.execute("SELECT segment, bytes FROM segments ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append(segment)
+            total -= size
+        self._drop_segments(evicted)
+        return evicted
+
+    def _lookup(self, keys):
+        entries = {}
+        # Stays under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            entries.update(
+                (key, (segment, row)) for key, segment, row in self._conn.execute(
+                    f"SELECT key, segment, row FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+            )
+        return entries
+
+    def get_many(self, keys: List[str]) -> Dict[int, np.ndarray]:
+        found = {}
+        with self._lock:
+            entries = self._lookup(list(set(keys)))
+            by_segment = {}
+            for pos, key in enumerate(keys):
+                entry = entries.get(key)
+                if entry:
+                    by_segment.setdefault(entry[0], []).append((pos, entry[1]))
+
+            missing = []
+            for segment, rows in by_segment.items():
+                try:
+                    matrix = np.load(self._segment_path(segment), mmap_mode="r")
+                except (OSError, ValueError):
+                    missing.append(segment)
+                    continue
+                positions = [pos for pos, _ in rows]
+                vectors = np.asarray(matrix[[row for _, row in rows]])
+                for pos, vector in zip(positions, vectors):
+                    found[pos] = vector
+
+            if by_segment:
+                now = time.time()
+                with self._transaction():
+                    self._conn.executemany(
+                        "UPDATE segments SET last_access = ? WHERE segment = ?",
+                        [(now, segment) for segment in by_segment if segment not in missing],
+                    )
+                    self._drop_segments(missing)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: List[str], vectors):
+        with self._lock:
+            with self._transaction():
+                # Another process may have stored some of these since our lookup
+                known = self._lookup(list(set(keys)))
+                new_rows = {}
+                for key, vector in zip(keys, vectors):
+                    if key not in known and key not in new_rows:
+                        new_rows[key] = vector
+                if not new_rows:
+                    return
+
+                segment = uuid.uuid4().hex
+                path = self._segment_path(segment)
+                np.save(path, np.ascontiguousarray(np.stack(list(new_rows.values())), dtype=np.float32))
+                self._conn.execute(
+                    "INSERT INTO segments (segment, bytes, rows, last_access) VALUES (?, ?, ?, ?)",
+                    (segment, os.path.getsize(path), len(new_rows), time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO entries (key, segment, row) VALUES (?, ?, ?)",
+                    [(key, segment, row) for row, key in enumerate(new_rows)],
+                )
+                evicted = self._evict()
+            self._remove_files(evicted)
+
+    def flush(self):
+        # Every update is committed as it happens
+        pass
+
+    def clear(self):
+        with self._lock:
+            with self._transaction():
+                segments = [row[0] for row in self._conn.execute("SELECT segment FROM segments")]
+                self._drop_segments(segments)
+            self._remove_files(segments)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM segments").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+    return _default_cache
@@ -0,0 +1,80 @@
+import numpy as np
+from typing import List
+
+from embedding_cache import chunk_key, get_embedding_cache
+from models import EMBEDDING_MODEL, get_embedder, in_use
+from tracing import span
+
+
+class EmbeddedChunks:
+    # Chunks from process_url together with one embedding row per chunk.
+    # Iterates like the plain list of chunk dicts so existing consumers keep working.
+    def __init__(self, chunks: List[dict], embeddings: np.ndarray, model_name: str = EMBEDDING_MODEL):
+        if len(chunks) != len(embeddings):
+            raise ValueError("Expected one embedding per chunk.")
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __getitem__(self, index):
+        return self.chunks[index]
+
+    def texts(self) -> List[str]:
+        return [chunk["text"] for chunk in self.chunks]
+
+    def subset(self, indices: List[int]) -> "EmbeddedChunks":
+        return EmbeddedChunks(
+            [self.chunks[i] for i in indices],
+            self.embeddings[indices],
+            model_name=self.model_name,
+        )
+
+
+def embed_chunks(chunks, model_name: str = EMBEDDING_MODEL, batch_size: int = 32, use_cache: bool = True) -> EmbeddedChunks:
+    if isinstance(chunks, EmbeddedChunks) and chunks.model_name == model_name:
+        return chunks
+
+    with span("embed", batch_size=batch_size) as s:
+        embedded = _embed(list(chunks), model_name, batch_size, use_cache)
+        s.set(chunks=len(embedded), cache_hits=embedded.cache_hits, cache_misses=embedded.cache_misses)
+    return embedded
+
+
+def _embed(chunks, model_name, batch_size, use_cache):
+    texts = [chunk["text"] for chunk in chunks]
+    cache = get_embedding_cache() if use_cache else None
+    keys = [chunk_key(model_name, text) for text in texts]
+    found = cache.get_many(keys) if cache else {}
+    missing = [i for i in range(len(texts)) if i not in found]
+
+    # The model is only loaded when something actually needs encoding
+    encoded = None
+    if missing or not texts:
+        with in_use(model_name):
+            model = get_embedder(model_name)
+            dim = model.get_sentence_embedding_dimension()
+            if missing:
+                encoded = model.encode([texts[i] for i in missing], batch_size=batch_size, convert_to_numpy=True)
+        if missing and cache:
+            cache.put_many([keys[i] for i in missing], encoded)
+    else:
+        dim = len(next(iter(found.values())))
+
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    for i, vector in found.items():
+        embeddings[i] = vector
+    if encoded is not None:
+        embeddings[missing] = encoded
+
+    embedded = EmbeddedChunks(chunks, embeddings, model_name=model_name)
+    embedded.cache_hits = len(found)
+    embedded.cache_misses = len(missing)
+    return embedded
@@ -0,0 +1,81 @@
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    # Lowercased word tokens; \w keeps macrons and other non-ASCII letters
+    # ("Jinchūriki") intact, which is what exact-name questions need
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    # Inverted index over chunk texts: term -> (chunk ids, term frequencies).
+    # A query only touches the postings of its own terms, so its cost grows
+    # with how common those terms are rather than with the number of chunks.
+    def __init__(self, texts, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings[term]
+                docs.append(doc)
+                tfs.append(tf)
+
+        self.num_docs = len(texts)
+        avg_length = float(lengths.mean()) if len(texts) else 0.0
+        # Per-document length normalization folded in once at build time
+        self._norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(len(texts), k1, dtype=np.float32)
+        self.postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+        self.idf = {
+            term: float(np.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5)))
+            for term, (docs, _) in self.postings.items()
+        }
+
+    def __len__(self):
+        return self.num_docs
+
+    @property
+    def nbytes(self):
+        return sum(docs.nbytes + tfs.nbytes for docs, tfs in self.postings.values()) + self._norm.nbytes
+
+    def scores(self, query):
+        # (chunk ids, scores) for the chunks sharing at least one term with the
+        # query, ids ascending; accumulated over the postings only
+        docs_parts = []
+        score_parts = []
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            docs_parts.append(docs)
+            score_parts.append(self.idf[term] * tfs * (self.k1 + 1) / (tfs + self._norm[docs]))
+        if not docs_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids, inverse = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(ids))
+        return ids.astype(np.int64), scores.astype(np.float32)
+
+    def search(self, query, top_k):
+        # (scores, chunk ids) of the best matches, best first; only chunks
+        # sharing at least one term with the query are returned
+        ids, scores = self.scores(query)
+        if len(ids) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], ids[order]
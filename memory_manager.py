@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import weakref
+
+import models
+from embedding_cache import CACHE_DIR
+from tracing import span
+
+MEMORY_BUDGET_MB = int(os.environ.get("ANIME_MEMORY_BUDGET_MB", "4096"))
+# Anything used more recently than this is never evicted, nor is a model in the middle of a call
+MIN_IDLE_SECONDS = float(os.environ.get("ANIME_MIN_IDLE_SECONDS", "30"))
+INDEX_SPILL_DIR = os.path.join(CACHE_DIR, "indexes")
+
+
+class MemoryManager:
+    # Keeps loaded models plus tracked retriever indexes under a byte budget.
+    # When over budget, the least recently used idle entry goes first: indexes
+    # are spilled to disk (reloaded on their next query), models are dropped
+    # from the registry (reloaded from the local Hugging Face cache).
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, min_idle_seconds=MIN_IDLE_SECONDS, spill_dir=INDEX_SPILL_DIR):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.min_idle_seconds = min_idle_seconds
+        self.spill_dir = spill_dir
+        # Weak so a retriever nobody references anymore is simply freed
+        self._indexes = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.evictions = {"model": 0, "index": 0}
+
+    def track_index(self, name, retriever):
+        with self._lock:
+            self._indexes[name] = retriever
+        self.enforce()
+        return retriever
+
+    def _entries(self):
+        entries = []
+        for name, entry in models.model_usage().items():
+            entries.append({
+                "kind": "model",
+                "name": name,
+                "bytes": entry["bytes"],
+                "last_used": entry["last_used"],
+                "busy": entry["busy"],
+            })
+        with self._lock:
+            indexes = list(self._indexes.items())
+        for name, retriever in indexes:
+            entries.append({
+                "kind": "index",
+                "name": name,
+                "bytes": retriever.nbytes,
+                "last_used": retriever.last_used,
+                "resident": retriever.resident,
+            })
+        return entries
+
+    def usage(self):
+        now = time.monotonic()
+        entries = self._entries()
+        for entry in entries:
+            entry["mb"] = entry.pop("bytes") / (1024 * 1024)
+            entry["idle_seconds"] = now - entry.pop("last_used")
+        return {
+            "budget_mb": self.budget_bytes / (1024 * 1024),
+            "used_mb": sum(entry["mb"] for entry in entries),
+            "evictions": dict(self.evictions),
+            "entries": sorted(entries, key=lambda entry: -entry["mb"]),
+        }
+
+    def enforce(self):
+        # Evicts LRU-first until under budget or nothing idle is left
+        entries = [entry for entry in self._entries() if entry["bytes"]]
+        used = sum(entry["bytes"] for entry in entries)
+        if used <= self.budget_bytes:
+            return []
+
+        cutoff = time.monotonic() - self.min_idle_seconds
+        evicted = []
+        for entry in sorted(entries, key=lambda entry: entry["last_used"]):
+            if used <= self.budget_bytes:
+                break
+            if entry["last_used"] > cutoff or entry.get("busy"):
+                continue
+            with span("evict", kind=entry["kind"], target=entry["name"], bytes=entry["bytes"]):
+                if entry["kind"] == "index":
+                    retriever = self._indexes.get(entry["name"])
+                    if retriever is None:
+                        continue
+                    retriever.spill(self.spill_dir)
+                elif not models.unload(entry["name"]):
+                    # A call started on it since usage was read
+                    continue
+            self.evictions[entry["kind"]] += 1
+            used -= entry["bytes"]
+            evicted.append((entry["kind"], entry["name"]))
+        return evicted
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_memory_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = MemoryManager()
+    return _manager
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from tracing import span
+
+SUMMARIZER_MODEL = "facebook/bart-large-cnn"
+QA_MODEL = "google/flan-t5-base"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# How the generation models run on CPU: "torch" (fp32), "int8" (dynamic
+# quantization of the Linear layers) or "onnx" (ONNX Runtime, needs optimum)
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = os.environ.get("ANIME_INFERENCE_BACKEND", "torch")
+ONNX_DIR = os.path.join(
+    os.environ.get("ANIME_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")),
+    "onnx",
+)
+
+# One instance per (kind, name) for the whole process. Models are only
+# loaded the first time something asks for them.
+_models: Dict[tuple, object] = {}
+_locks: Dict[tuple, threading.Lock] = {}
+_last_used: Dict[tuple, float] = {}
+# name -> number of calls currently running on that model; unload() skips
+# busy names so a long generation is never pulled out from under its caller
+_busy: Dict[str, int] = {}
+_registry_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def _get_or_load(key, loader):
+    _last_used[key] = time.monotonic()
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+
+    # Per-key lock so two threads asking for the same model load it once,
+    # while different models can still load in parallel.
+    with lock:
+        model = _models.get(key)
+        if model is None:
+            with span("model_load", kind=key[0], model="/".join(key[1:])):
+                model = loader()
+            _models[key] = model
+    return model
+
+
+def get_tokenizer(name: str):
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(name)
+    return _get_or_load(("tokenizer", name), load)
+
+
+def _load_torch(name):
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(name)
+    model.eval()
+    return model
+
+
+def _load_int8(name):
+    import torch
+    # Weights of every Linear layer become int8; activations are quantized on
+    # the fly, so no calibration data is needed
+    return torch.quantization.quantize_dynamic(_load_torch(name), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(name):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("The onnx inference backend needs optimum[onnxruntime] installed.") from e
+
+    # The first load exports the model; later loads reuse the exported graphs
+    path = os.path.join(ONNX_DIR, name.replace("/", "--"))
+    if os.path.isdir(path):
+        return ORTModelForSeq2SeqLM.from_pretrained(path)
+    model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+    model.save_pretrained(path)
+    return model
+
+
+SEQ2SEQ_LOADERS = {
+    "torch": _load_torch,
+    "int8": _load_int8,
+    "onnx": _load_onnx,
+}
+
+
+def get_seq2seq_model(name: str, backend: Optional[str] = None):
+    backend = backend or INFERENCE_BACKEND
+    if backend not in SEQ2SEQ_LOADERS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose from: {', '.join(SEQ2SEQ_LOADERS)}")
+    return _get_or_load(("seq2seq", name, backend), lambda: SEQ2SEQ_LOADERS[backend](name))
+
+
+def get_pipeline(task: str, name: str, backend: Optional[str] = None):
+    backend = backend or INFERENCE_BACKEND
+
+    def load():
+        from transformers import pipeline
+        return pipeline(task, model=get_seq2seq_model(name, backend), tokenizer=get_tokenizer(name))
+    return _get_or_load(("pipeline", task, name, backend), load)
+
+
+def get_embedder(name: str = EMBEDDING_MODEL):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return _get_or_load(("embedder", name), load)
+
+
+def get_summarizer(backend: Optional[str] = None):
+    return get_pipeline("summarization", SUMMARIZER_MODEL, backend)
+
+
+def get_qa_pipeline(backend: Optional[str] = None):
+    return get_pipeline("text2text-generation", QA_MODEL, backend)
+
+
+def get_qa_tokenizer():
+    return get_tokenizer(QA_MODEL)
+
+
+def get_qa_model(backend: Optional[str] = None):
+    return get_seq2seq_model(QA_MODEL, backend)
+
+
+def loaded_models():
+    return list(_models)
+
+
+def _key_name(key):
+    # ("tokenizer", name), ("seq2seq", name, backend), ("pipeline", task, name, backend)
+    return key[2] if key[0] == "pipeline" else key[1]
+
+
+@contextmanager
+def in_use(name: str):
+    # Marks name busy for the length of a call, e.g. a whole generate()
+    with _registry_lock:
+        _busy[name] = _busy.get(name, 0) + 1
+    try:
+        yield
+    finally:
+        now = time.monotonic()
+        with _registry_lock:
+            _busy[name] -= 1
+            if not _busy[name]:
+                del _busy[name]
+            for key in list(_models):
+                if _key_name(key) == name:
+                    _last_used[key] = now
+
+
+def _onnx_nbytes(model):
+    # ONNX Runtime sessions hold roughly their exported graphs' weights
+    path = getattr(model, "model_save_dir", None)
+    if path is None or not os.path.isdir(path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if ".onnx" in f
+    )
+
+
+def _module_nbytes(module, seen):
+    if id(module) in seen:
+        return 0
+    seen.add(id(module))
+    state_dict = getattr(module, "state_dict", None)
+    if not callable(state_dict):
+        return _onnx_nbytes(module)
+    total = 0
+    # state_dict rather than parameters() so int8 packed weights are counted
+    for value in state_dict().values():
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if hasattr(tensor, "element_size"):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def model_usage():
+    # name -> approximate resident bytes and last use, with the model, its
+    # tokenizer and any pipeline wrapping it counted once under one name
+    usage = {}
+    seen = set()
+    for key, model in list(_models.items()):
+        name = _key_name(key)
+        entry = usage.setdefault(name, {"bytes": 0, "last_used": 0.0, "keys": [], "busy": name in _busy})
+        entry["bytes"] += _module_nbytes(getattr(model, "model", model), seen)
+        entry["last_used"] = max(entry["last_used"], _last_used.get(key, 0.0))
+        entry["keys"].append(key)
+    return usage
+
+
+def unload(name: str):
+    # Drops every registry entry for name; the weights stay in the Hugging Face
+    # cache on disk, so the next get_* call reloads them without a download.
+    # Returns 0 without unloading while a call marked in_use is running.
+    with _registry_lock:
+        if name in _busy:
+            return 0
+        keys = [key for key in _models if _key_name(key) == name]
+        for key in keys:
+            _models.pop(key, None)
+            _last_used.pop(key, None)
+    if keys:
+        import gc
+        gc.collect()
+    return len(keys)
+
+
+WARMUP_LOADERS = {
+    "embedder": get_embedder,
+    "summarizer": get_summarizer,
+    "qa": get_qa_pipeline,
+}
+
+
+def warm_up(names: Iterable[str] = ("embedder", "summarizer", "qa"), background: bool = True):
+    global _warmup_thread
+
+    names = list(names)
+
+    def run():
+        for name in names:
+            try:
+                WARMUP_LOADERS[name]()
+            except Exception as e:
+                print(f"Failed to warm up {name}: {e}")
+
+    if not background:
+        run()
+        return None
+
+    with _registry_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
@@ -1,7 +1,19 @@
 
-from scraping.final_scraper import scrape_fandom_page
+import threading
+
+from scraping.final_scraper import canonicalize_url, scrape_fandom_page
+from scraping.crawler import crawl_chunks, crawl_wiki
+from scraping.chunking import CHUNK_OVERLAP, CHUNK_TOKENS, chunk_sections
 from summarization.final_summarizer import summarize_chunks
-from questioning.final_questioner import raw_ask_question 
+from questioning.final_questioner import raw_ask_question, raw_ask_questions
+from embeddings import embed_chunks
+from corpus_index import get_corpus_index
+from memory_manager import get_memory_manager
+from retriever import Retriever
+from models import INFERENCE_BACKEND, QA_MODEL, SUMMARIZER_MODEL, get_qa_tokenizer, get_tokenizer
+from result_cache import chunk_id, content_fingerprint, get_result_cache, get_semantic_cache, make_key
+from summarization.final_summarizer import SUMMARY_MODE, TOKEN_BUDGET
+from tracing import span
 
 MAX_INPUT_TOKENS = 480
 
@@ -11,17 +23,245 @@ def truncate_prompt(prompt, tokenizer, max_tokens=MAX_INPUT_TOKENS):
     tokens = tokenizer(prompt, truncation=True, max_length=max_tokens, return_tensors='pt')
     return tokenizer.decode(tokens['input_ids'][0], skip_special_tokens=True)
 
-def process_url(url):
-    data = scrape_fandom_page(url)
-    chunks = data['chunks'] 
+def scrape_and_chunk(url, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    # The scraped page (title, url, links) with its chunks split to the token budget
+    with span("process_url", url=url) as s:
+        data = scrape_fandom_page(url)
+        chunks = data['chunks'] 
+        if max_tokens:
+            with span("chunk", sections=len(chunks)) as c:
+                chunks = chunk_sections(chunks, max_tokens=max_tokens, overlap=overlap)
+                c.set(chunks=len(chunks), tokens=sum(chunk.get('token_count', 0) for chunk in chunks))
+        s.set(chunks=len(chunks))
 
     print("done with chuncks")
-    return chunks
+    return dict(data, chunks=chunks)
+
+def process_url(url, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    return scrape_and_chunk(url, max_tokens=max_tokens, overlap=overlap)['chunks']
+
+def process_wiki(url, max_pages=50, max_depth=2, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    # Streams chunks (tagged with their page url and title) as pages finish
+    for chunk in crawl_chunks(url, max_pages=max_pages, max_depth=max_depth):
+        if max_tokens:
+            yield from chunk_sections([chunk], max_tokens=max_tokens, overlap=overlap)
+        else:
+            yield chunk
+
+def ingest_wiki(url, max_pages=50, max_depth=2, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    # Crawls a wiki into the shared on-disk corpus; pages whose content is
+    # unchanged are skipped. Answer over it with
+    # ask_questions(questions, get_corpus_index().retriever(wiki=...)).
+    corpus = get_corpus_index()
+    updated = 0
+    for page in crawl_wiki([url], max_pages=max_pages, max_depth=max_depth):
+        chunks = page['chunks']
+        if max_tokens:
+            chunks = chunk_sections(chunks, max_tokens=max_tokens, overlap=overlap)
+        if chunks and corpus.add_page(page['url'], chunks, title=page['title']):
+            updated += 1
+    print(f"done with corpus ({updated} pages added or updated)")
+    return corpus
 
-def summarization(paragraphs):
-    summary = summarize_chunks(paragraphs)
+def embed(paragraphs):
+    embedded = embed_chunks(paragraphs)
+    print(f"done with embeddings ({embedded.cache_hits} cached, {embedded.cache_misses} encoded)")
+    return embedded
+
+def _summary_key(paragraphs, num_clusters, mode, token_budget):
+    return make_key(content_fingerprint(paragraphs), SUMMARIZER_MODEL, INFERENCE_BACKEND, num_clusters, mode, token_budget)
+
+def summarization(paragraphs, num_clusters=5, mode=SUMMARY_MODE, token_budget=TOKEN_BUDGET, use_cache=True):
+    with span("summarization", mode=mode, chunks=len(paragraphs)) as s:
+        cache = get_result_cache() if use_cache else None
+        key = _summary_key(paragraphs, num_clusters, mode, token_budget)
+        summary = cache.get("summary", key) if cache else None
+        s.set(cache_hit=summary is not None)
+        if summary is None:
+            summary = summarize_chunks(paragraphs, num_clusters=num_clusters, mode=mode, token_budget=token_budget)
+            if cache and not summary.startswith("Summarization failed"):
+                cache.set("summary", key, summary)
     print("done with summarization")
     return summary
 
-def ask_question(question, retriever):
-    return raw_ask_question(question, retriever)
+def _answer_key(question, hits):
+    # Retrieved chunk ids are content hashes, so changed pages never hit stale answers
+    return make_key(question.strip().lower(), QA_MODEL, INFERENCE_BACKEND, MAX_INPUT_TOKENS, [chunk_id(chunk) for chunk, _ in hits])
+
+def _cacheable(answer):
+    return not answer.startswith("Error:") and answer != "No relevant context found."
+
+def ask_question(question, retriever, use_cache=True):
+    if retriever is None or not use_cache:
+        with span("ask_question"):
+            return raw_ask_question(question, retriever)
+    return ask_questions([question], retriever, batch_size=1)[0]
+
+def ask_questions(questions, retriever, batch_size=8, use_cache=True):
+    questions = list(questions)
+    if retriever is None or not use_cache:
+        return raw_ask_questions(questions, retriever, batch_size=batch_size)
+
+    with span("ask_questions", questions=len(questions), batch_size=batch_size) as s:
+        return _ask_questions_cached(questions, retriever, batch_size, s)
+
+def _ask_questions_cached(questions, retriever, batch_size, s):
+    # The query embeddings from retrieval double as keys for the semantic cache
+    cache = get_result_cache()
+    semantic = get_semantic_cache()
+    all_hits, embeddings = retriever.query_many(questions, top_k=3, return_scores=True, return_embeddings=True)
+    keys = [_answer_key(q, hits) for q, hits in zip(questions, all_hits)]
+    chunk_ids = [[chunk_id(chunk) for chunk, _ in hits] for hits in all_hits]
+
+    answers = []
+    for i, key in enumerate(keys):
+        answer = cache.get("answer", key)
+        if answer is None:
+            answer = semantic.lookup(retriever.fingerprint, embeddings[i], chunk_ids[i])
+        answers.append(answer)
+
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    s.set(cache_hits=len(questions) - len(missing))
+    if missing:
+        generated = raw_ask_questions(
+            [questions[i] for i in missing], retriever, batch_size=batch_size, hits=[all_hits[i] for i in missing]
+        )
+        for i, answer in zip(missing, generated):
+            answers[i] = answer
+            if _cacheable(answer):
+                cache.set("answer", keys[i], answer)
+                semantic.add(retriever.fingerprint, embeddings[i], chunk_ids[i], answer)
+    return answers
+
+def _stream(run, tokenizer):
+    # Runs generation on a worker thread and yields decoded text as tokens
+    # arrive; the generator's return value is the full result of run
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    result = {}
+
+    def target():
+        try:
+            result["value"] = run(streamer)
+        except Exception as e:
+            result["value"] = f"Error: {e}"
+        finally:
+            # Unblocks the consumer even when generation never started
+            streamer.end()
+
+    worker = threading.Thread(target=target, name="stream-generate", daemon=True)
+    worker.start()
+    streamed = False
+    for piece in streamer:
+        if piece:
+            streamed = True
+            yield piece
+    worker.join()
+    # Early returns (errors, empty context) never reach the streamer
+    if not streamed and result.get("value"):
+        yield result["value"]
+    return result.get("value", "")
+
+def stream_summarization(paragraphs, num_clusters=5, mode=SUMMARY_MODE, token_budget=TOKEN_BUDGET, use_cache=True):
+    # Same result as summarization(), yielded piece by piece
+    cache = get_result_cache() if use_cache else None
+    key = _summary_key(paragraphs, num_clusters, mode, token_budget)
+    summary = cache.get("summary", key) if cache else None
+    if summary is not None:
+        yield summary
+        return summary
+
+    summary = yield from _stream(
+        lambda streamer: summarize_chunks(
+            paragraphs, num_clusters=num_clusters, mode=mode, token_budget=token_budget, streamer=streamer
+        ),
+        get_tokenizer(SUMMARIZER_MODEL),
+    )
+    if cache and not summary.startswith(("Summarization failed", "Error:")):
+        cache.set("summary", key, summary)
+    return summary
+
+def stream_answer(question, retriever, use_cache=True):
+    # Same result as ask_question(), yielded piece by piece
+    if retriever is None:
+        yield "No retriever context available."
+        return
+
+    hits, embedding = retriever.query(question, top_k=3, return_scores=True, return_embedding=True)
+    key = _answer_key(question, hits)
+    chunk_ids = [chunk_id(chunk) for chunk, _ in hits]
+    if use_cache:
+        answer = get_result_cache().get("answer", key)
+        if answer is None:
+            answer = get_semantic_cache().lookup(retriever.fingerprint, embedding, chunk_ids)
+        if answer is not None:
+            yield answer
+            return
+
+    answer = yield from _stream(
+        lambda streamer: raw_ask_question(question, retriever, hits=hits, streamer=streamer),
+        get_qa_tokenizer(),
+    )
+    if use_cache and _cacheable(answer):
+        get_result_cache().set("answer", key, answer)
+        get_semantic_cache().add(retriever.fingerprint, embedding, chunk_ids, answer)
+
+class IngestJob:
+    # Scrape -> chunk -> embed -> index -> summarize for one URL on a
+    # background thread. Readers poll status, chunks, retriever and
+    # summary_text() while it runs; the retriever is usable before the
+    # summary is finished.
+    def __init__(self, url):
+        self.url = url
+        self.status = "queued"
+        self.chunks = 0
+        self.retriever = None
+        self.summary = None
+        self.error = None
+        self._summary_parts = []
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def done(self):
+        return self.status in ("ready", "failed")
+
+    def summary_text(self):
+        return self.summary if self.summary is not None else "".join(self._summary_parts)
+
+    def _run(self):
+        try:
+            self.status = "scraping"
+            page = scrape_and_chunk(self.url)
+            paragraphs = page['chunks']
+            self.chunks = len(paragraphs)
+
+            self.status = "indexing"
+            embedded = embed(paragraphs)
+            self.retriever = get_memory_manager().track_index(self.url, Retriever(embedded))
+            self._add_to_corpus(page['title'], embedded)
+
+            self.status = "summarizing"
+            for piece in stream_summarization(embedded):
+                self._summary_parts.append(piece)
+            self.summary = "".join(self._summary_parts)
+            self.status = "ready"
+            get_memory_manager().enforce()
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+
+    def _add_to_corpus(self, title, embedded):
+        # Persists the page so other sessions and restarts can query it from
+        # the corpus, under the same canonical URL the crawler uses. The page
+        # is already indexed for this job, so a corpus failure is only logged.
+        try:
+            get_corpus_index().add_page(canonicalize_url(self.url), embedded, title=title)
+        except Exception as e:
+            print(f"Failed to add {self.url} to the corpus: {e}")
@@ -1,28 +1,226 @@
-from transformers import pipeline, AutoTokenizer
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+from models import QA_MODEL, get_qa_model, get_qa_tokenizer, in_use
+from scraping.chunking import tokenize_chunks
+from tracing import span
 
-qa = pipeline("text2text-generation", model="google/flan-t5-base")
-tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-base")
 MAX_INPUT_TOKENS = 480
+PROMPT_PREFIX = "Answer the question based on the text below:\n\n"
+CONTEXT_CACHE_SIZE = 8
+# Room kept for the prompt prefix and at least one retrieved window, however long the question
+MIN_CONTEXT_TOKENS = 160
+
+_prefix_ids = {}
+_context_states = OrderedDict()
+_context_lock = threading.Lock()
 
 def truncate_prompt(prompt, tokenizer, max_tokens=MAX_INPUT_TOKENS):
     tokens = tokenizer(prompt, truncation=True, max_length=max_tokens, return_tensors='pt')
     return tokenizer.decode(tokens['input_ids'][0], skip_special_tokens=True)
 
-def raw_ask_question(question, retriever):
-    if retriever is None:
+def allocate_budget(lengths, scores, budget):
+    # Split the context budget across chunks in proportion to retrieval score.
+    # Chunks shorter than their share keep all their tokens and hand the rest on.
+    allocation = [0] * len(lengths)
+    remaining = list(range(len(lengths)))
+    while remaining and budget > 0:
+        weights = {i: max(scores[i], 0.0) + 1e-3 for i in remaining}
+        total = sum(weights.values())
+        fits = [i for i in remaining if lengths[i] <= budget * weights[i] / total]
+        if not fits:
+            for i in remaining:
+                allocation[i] = int(budget * weights[i] / total)
+            break
+        for i in fits:
+            allocation[i] = lengths[i]
+            budget -= lengths[i]
+            remaining.remove(i)
+    return allocation
+
+def _question_ids(question, tokenizer, max_tokens=MAX_INPUT_TOKENS - MIN_CONTEXT_TOKENS):
+    ids = tokenizer(f"\n\nQuestion: {question}\nAnswer:", add_special_tokens=False)['input_ids'] + [tokenizer.eos_token_id]
+    if len(ids) <= max_tokens:
+        return ids
+    # Cut the question, not the closing "Answer:" the model is prompted with
+    tail = tokenizer("\nAnswer:", add_special_tokens=False)['input_ids'] + [tokenizer.eos_token_id]
+    return ids[:max_tokens - len(tail)] + tail
+
+def pack_context_ids(hits, tokenizer, budget):
+    # hits: (chunk, score) pairs. Chunk token ids come from index time, so the
+    # context is assembled at token level without tokenizing chunk text again.
+    # Keyed by model name, not tokenizer object, so an unloaded tokenizer is not kept alive
+    name = tokenizer.name_or_path
+    if name not in _prefix_ids:
+        _prefix_ids[name] = tokenizer(PROMPT_PREFIX, add_special_tokens=False)['input_ids']
+    prefix = _prefix_ids[name]
+
+    chunks = tokenize_chunks([chunk for chunk, _ in hits], tokenizer)
+    budget = max(0, budget - len(prefix))
+    allocation = allocate_budget([len(c['token_ids']) for c in chunks], [score for _, score in hits], budget)
+
+    context = list(prefix)
+    for chunk, size in zip(chunks, allocation):
+        context.extend(chunk['token_ids'][:size])
+    return context
+
+def build_prompt_ids(question, hits, tokenizer, max_tokens=MAX_INPUT_TOKENS):
+    # Only the question is tokenized per call
+    suffix = _question_ids(question, tokenizer, max_tokens - MIN_CONTEXT_TOKENS)
+    with span("tokenize") as s:
+        input_ids = pack_context_ids(hits, tokenizer, max_tokens - len(suffix)) + suffix
+        s.set(prompt_tokens=len(input_ids))
+    max_output_tokens = min(200, int(len(input_ids) * 0.5) + 20)
+    return input_ids, max_output_tokens
+
+def generate_from_ids(batch_ids, max_length, streamer=None):
+    tokenizer = get_qa_tokenizer()
+    width = max(len(ids) for ids in batch_ids)
+    input_ids = torch.full((len(batch_ids), width), tokenizer.pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_ids), width), dtype=torch.long)
+    for row, ids in enumerate(batch_ids):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+
+    with span("generate", batch_size=len(batch_ids), input_tokens=int(attention_mask.sum())) as s, \
+            in_use(QA_MODEL), torch.no_grad():
+        outputs = get_qa_model().generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_length=max_length,
+            do_sample=False,
+            streamer=streamer,
+        )
+        s.set(output_tokens=int((outputs != tokenizer.pad_token_id).sum()))
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+
+def encode_prefix(prefix_ids):
+    with in_use(QA_MODEL), torch.no_grad():
+        return get_qa_model().get_encoder()(
+            input_ids=torch.tensor([prefix_ids], dtype=torch.long),
+            attention_mask=torch.ones((1, len(prefix_ids)), dtype=torch.long),
+        ).last_hidden_state
+
+def cached_prefix_states(key, prefix_ids):
+    # Small LRU so follow-up questions on the same retrieved context skip its encoding
+    with _context_lock:
+        states = _context_states.get(key)
+        if states is not None:
+            _context_states.move_to_end(key)
+            return states
+    states = encode_prefix(prefix_ids)
+    with _context_lock:
+        _context_states[key] = states
+        while len(_context_states) > CONTEXT_CACHE_SIZE:
+            _context_states.popitem(last=False)
+    return states
+
+def generate_with_shared_prefix(prefix_ids, suffix_ids_list, prefix_states=None, **generate_kwargs):
+    # Encodes the shared context once and only the short per-question suffixes per
+    # question, then lets the decoder attend over both. T5's encoder is
+    # bidirectional, so this approximates full-prompt encoding (Fusion-in-Decoder
+    # style); benchmarks/bench_shared_context.py measures speed and agreement.
+    tokenizer = get_qa_tokenizer()
+    if prefix_states is None:
+        prefix_states = encode_prefix(prefix_ids)
+
+    n = len(suffix_ids_list)
+    width = max(len(ids) for ids in suffix_ids_list)
+    suffix_ids = torch.full((n, width), tokenizer.pad_token_id, dtype=torch.long)
+    suffix_mask = torch.zeros((n, width), dtype=torch.long)
+    for row, ids in enumerate(suffix_ids_list):
+        suffix_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        suffix_mask[row, :len(ids)] = 1
+
+    with in_use(QA_MODEL), torch.no_grad():
+        model = get_qa_model()
+        suffix_states = model.get_encoder()(input_ids=suffix_ids, attention_mask=suffix_mask).last_hidden_state
+        states = torch.cat([prefix_states.expand(n, -1, -1), suffix_states], dim=1)
+        mask = torch.cat([torch.ones((n, prefix_states.shape[1]), dtype=torch.long), suffix_mask], dim=1)
+        outputs = model.generate(
+            encoder_outputs=BaseModelOutput(last_hidden_state=states),
+            attention_mask=mask,
+            **generate_kwargs,
+        )
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+
+def _context_key(hits):
+    return tuple((chunk.get('section'), hash(chunk['text'])) for chunk, _ in hits)
+
+def _ask_shared(questions, hits, tokenizer, streamer=None):
+    suffixes = [_question_ids(q, tokenizer) for q in questions]
+    longest = max(len(ids) for ids in suffixes)
+    context = pack_context_ids(hits, tokenizer, MAX_INPUT_TOKENS - longest)
+    states = cached_prefix_states(tuple(context), context)
+    max_output_tokens = min(200, int((len(context) + longest) * 0.5) + 20)
+    return generate_with_shared_prefix(context, suffixes, prefix_states=states, max_length=max_output_tokens,
+                                      do_sample=False, streamer=streamer)
+
+def raw_ask_question(question, retriever, shared_context=False, hits=None, streamer=None):
+    if retriever is None and hits is None:
         return "No retriever context available."
 
-    hits = retriever.query(question, top_k=3)
+    # hits: (chunk, score) pairs when the caller already ran retrieval
+    if hits is None:
+        hits = retriever.query(question, top_k=3, return_scores=True)
     if not hits:
         return "No relevant context found."
 
-    context = "\n".join([h['text'] if isinstance(h, dict) else str(h) for h in hits])
-    prompt = f"Answer the question based on the text below:\n\n{context}\n\nQuestion: {question}\nAnswer:"
-    prompt = truncate_prompt(prompt, tokenizer)
-    input_tokens = tokenizer(prompt, return_tensors='pt')['input_ids'].shape[1]
-    max_output_tokens = min(200, int(input_tokens * 0.5) + 20)
-
+    tokenizer = get_qa_tokenizer()
     try:
-        return qa(prompt, max_length=max_output_tokens, do_sample=False)[0]['generated_text']
+        if shared_context:
+            return _ask_shared([question], hits, tokenizer, streamer=streamer)[0]
+        input_ids, max_output_tokens = build_prompt_ids(question, hits, tokenizer)
+        return generate_from_ids([input_ids], max_output_tokens, streamer=streamer)[0]
     except Exception as e:
         return f"Error: {e}"
+
+def raw_ask_questions(questions, retriever, batch_size=8, shared_context=False, hits=None):
+    questions = list(questions)
+    if retriever is None and hits is None:
+        return ["No retriever context available."] * len(questions)
+
+    answers = [None] * len(questions)
+    tokenizer = get_qa_tokenizer()
+    pending = []
+    groups = OrderedDict()
+    if hits is None:
+        hits = retriever.query_many(questions, top_k=3, return_scores=True)
+    for i, (question, item_hits) in enumerate(zip(questions, hits)):
+        if not item_hits:
+            answers[i] = "No relevant context found."
+        elif shared_context:
+            groups.setdefault(_context_key(item_hits), (item_hits, []))[1].append(i)
+        else:
+            input_ids, max_output_tokens = build_prompt_ids(question, item_hits, tokenizer)
+            pending.append((max_output_tokens, i, input_ids))
+
+    # Questions that retrieved the same chunks share one context encoding
+    for group_hits, indices in groups.values():
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            try:
+                for i, answer in zip(batch, _ask_shared([questions[i] for i in batch], group_hits, tokenizer)):
+                    answers[i] = answer
+            except Exception as e:
+                for i in batch:
+                    answers[i] = f"Error: {e}"
+
+    # Prompts with similar output budgets share a batch, so one max_length fits all of them
+    pending.sort(key=lambda item: item[:2])
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            results = generate_from_ids(
+                [input_ids for _, _, input_ids in batch],
+                max(budget for budget, _, _ in batch),
+            )
+            for (_, i, _), answer in zip(batch, results):
+                answers[i] = answer
+        except Exception as e:
+            for _, i, _ in batch:
+                answers[i] = f"Error: {e}"
+    return answers
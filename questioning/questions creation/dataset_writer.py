@@ -0,0 +1,149 @@
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List
+
+FIELDNAMES = ["question", "answer", "section", "context"]
+FLUSH_EVERY = 50
+
+
+def chunk_hash(chunk: Dict) -> str:
+    return hashlib.sha256(f"{chunk.get('section', '')}\0{chunk['text']}".encode("utf-8")).hexdigest()
+
+
+class QADatasetWriter:
+    # Append-only JSONL sink. Rows are buffered and appended in batches, one
+    # whole chunk at a time, and every row carries its chunk hash. A checkpoint
+    # file also records chunks that produced no pairs, so a rerun skips every
+    # chunk that was already handled. CSV/Excel/Parquet are exported once at the end.
+    def __init__(self, path: str, checkpoint_path: str = None, flush_every: int = FLUSH_EVERY, seed_csv: str = None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+        self.flush_every = flush_every
+        self._rows = []
+        self._hashes = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        if seed_csv and not os.path.exists(path) and os.path.exists(seed_csv):
+            self._import_csv(seed_csv)
+        for file_path in (self.path, self.checkpoint_path):
+            self._repair_tail(file_path)
+        self.done = self._load_done()
+
+    @staticmethod
+    def _repair_tail(file_path):
+        # An interrupted write can leave a torn last line; drop it so the next
+        # append does not glue a good row onto it, which would lose both
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _import_csv(self, csv_path):
+        # Carry rows from the old CSV dataset over so the final export keeps them
+        with open(csv_path, encoding="utf-8", newline="") as src, open(self.path, "a", encoding="utf-8") as dst:
+            for row in csv.DictReader(src):
+                dst.write(json.dumps({k: row.get(k, "") for k in FIELDNAMES}, ensure_ascii=False) + "\n")
+
+    def _load_done(self):
+        done = set()
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                done.update(line.strip() for line in f if line.strip())
+        self._drop_unchecked_rows(done)
+        return done
+
+    def _drop_unchecked_rows(self, done):
+        # Rows reach the data file before their chunk reaches the checkpoint,
+        # so only the last batch can be missing from it, possibly cut short.
+        # Dropping it makes a rerun regenerate those chunks in full instead of
+        # keeping a partial set of their pairs.
+        if not os.path.exists(self.path):
+            return
+        keep = 0
+        with open(self.path, "rb") as f:
+            for line in iter(f.readline, b""):
+                try:
+                    key = json.loads(line).get("chunk_hash")
+                except ValueError:
+                    key = None
+                if not key or key in done:
+                    keep = f.tell()
+        if keep < os.path.getsize(self.path):
+            with open(self.path, "rb+") as f:
+                f.truncate(keep)
+
+    def iter_rows(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def is_done(self, chunk: Dict) -> bool:
+        return chunk_hash(chunk) in self.done
+
+    def pending(self, chunks: Iterable[Dict]) -> List[Dict]:
+        return [chunk for chunk in chunks if not self.is_done(chunk)]
+
+    def write(self, chunk: Dict, qa_pairs: List[Dict]):
+        key = chunk_hash(chunk)
+        self._rows.extend(dict(pair, chunk_hash=key) for pair in qa_pairs)
+        self._hashes.append(key)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows and not self._hashes:
+            return
+        if self._rows:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in self._rows))
+                f.flush()
+                os.fsync(f.fileno())
+        # Chunks count as done only once their rows and then the checkpoint are on disk
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write("".join(key + "\n" for key in self._hashes))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(self._hashes)
+        self._rows = []
+        self._hashes = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def export(self, csv_path: str = None, xlsx_path: str = None, parquet_path: str = None) -> int:
+        self.flush()
+        count = 0
+        if csv_path:
+            tmp_path = f"{csv_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction="ignore")
+                writer.writeheader()
+                for row in self.iter_rows():
+                    writer.writerow(row)
+                    count += 1
+            os.replace(tmp_path, csv_path)
+
+        if xlsx_path or parquet_path:
+            import pandas as pd
+            df = pd.DataFrame([{k: row.get(k, "") for k in FIELDNAMES} for row in self.iter_rows()], columns=FIELDNAMES)
+            if xlsx_path:
+                df.to_excel(xlsx_path, index=False)
+            if parquet_path:
+                df.to_parquet(parquet_path, index=False)
+            count = len(df)
+        return count
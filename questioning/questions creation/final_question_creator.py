@@ -1,24 +1,31 @@
-from transformers import pipeline, AutoTokenizer
 from typing import List, Dict
 import csv
 import os
 import re
+import sys
 import pandas as pd
 
-qa_generator = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-base",
-    max_length=512,
-    do_sample=True,
-    temperature=0.7
-)
-tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-base")
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from models import get_qa_pipeline, get_qa_tokenizer
+
+# Sampling settings for dataset generation; the flan-t5 model itself is shared
+# with the app's answering path through the model registry.
+GENERATION_KWARGS = {
+    "max_length": 512,
+    "do_sample": True,
+    "temperature": 0.7,
+}
 
 MAX_INPUT_TOKENS = 480
 
 def truncate_text(text, max_tokens=MAX_INPUT_TOKENS):
-    tokens = tokenizer(text, truncation=True, max_length=max_tokens, return_tensors='pt')
-    return tokenizer.decode(tokens['input_ids'][0], skip_special_tokens=True)
+    # Cut the original text at the last kept token instead of decoding the ids back
+    tokenizer = get_qa_tokenizer()
+    tokens = tokenizer(text, truncation=True, max_length=max_tokens, return_offsets_mapping=True)
+    return text[:max((end for _, end in tokens['offset_mapping']), default=0)]
 
 def fix_spacing(text: str) -> str:
     text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
@@ -44,24 +51,52 @@ def extract_questions_from_output(output: str) -> List[str]:
             questions.append(line.strip()[2:].strip())
     return questions
 
-def generate_questions(chunk: Dict, num_questions: int = 3, simple_prompt: bool = False) -> List[str]:
+def build_question_prompt(chunk: Dict, num_questions: int = 3, simple_prompt: bool = False) -> str:
     text_fixed = fix_spacing(chunk['text'])
     truncated_text = truncate_text(text_fixed, max_tokens=MAX_INPUT_TOKENS - 100)
 
     if simple_prompt:
-        prompt = (
+        return (
             f"Generate {num_questions} simple questions from the text below, each starting with 'Q:' on a new line.\n\n"
             f"TEXT:\n{truncated_text}"
         )
-    else:
-        prompt = (
-            f"You are an expert in anime trivia. Given the text below, generate exactly {num_questions} "
-            f"questions only, each starting with 'Q:' on a new line.\n\nTEXT:\n{truncated_text}"
-        )
+    return (
+        f"You are an expert in anime trivia. Given the text below, generate exactly {num_questions} "
+        f"questions only, each starting with 'Q:' on a new line.\n\nTEXT:\n{truncated_text}"
+    )
+
+def build_answer_context(chunk: Dict) -> str:
+    base_prompt = (
+        f"You are an expert in anime trivia. Given the text below and a question, provide a clear and concise answer. "
+        f"Format your output as 'A: ...'\n\nTEXT:\n"
+    )
+    text_fixed = fix_spacing(chunk['text'])
+    truncated_text = truncate_text(text_fixed, max_tokens=MAX_INPUT_TOKENS - 150)
+    return f"{base_prompt}{truncated_text}"
+
+def build_answer_prompt(chunk: Dict, question: str, context: str = None) -> str:
+    # context lets callers build the shared chunk part once for several questions
+    context = context if context is not None else build_answer_context(chunk)
+    return f"{context}\n\nQ: {question}\nA:"
+
+def parse_answer(output: str) -> str:
+    answer_match = re.search(r"A:\s*(.*)", output, re.IGNORECASE | re.DOTALL)
+    return answer_match.group(1).strip() if answer_match else output.strip()
+
+def make_qa_pair(chunk: Dict, question: str, answer: str) -> Dict:
+    return {
+        "question": question,
+        "answer": answer,
+        "section": clean_section(chunk.get("section", "")),
+        "context": clean_context(chunk["text"])
+    }
+
+def generate_questions(chunk: Dict, num_questions: int = 3, simple_prompt: bool = False) -> List[str]:
+    prompt = build_question_prompt(chunk, num_questions=num_questions, simple_prompt=simple_prompt)
 
     print("\n Question prompt sent to model:\n", prompt[:500], "..." if len(prompt) > 500 else "")
     try:
-        result = qa_generator(prompt)
+        result = get_qa_pipeline()(prompt, **GENERATION_KWARGS)
         output = result[0]['generated_text']
         print("\nRaw questions output:\n", output)
     except Exception as e:
@@ -73,26 +108,18 @@ def generate_questions(chunk: Dict, num_questions: int = 3, simple_prompt: bool
     return questions
 
 def generate_answer(chunk: Dict, question: str) -> str:
-    base_prompt = (
-        f"You are an expert in anime trivia. Given the text below and a question, provide a clear and concise answer. "
-        f"Format your output as 'A: ...'\n\nTEXT:\n"
-    )
-    text_fixed = fix_spacing(chunk['text'])
-    truncated_text = truncate_text(text_fixed, max_tokens=MAX_INPUT_TOKENS - 150)
-    prompt = f"{base_prompt}{truncated_text}\n\nQ: {question}\nA:"
+    prompt = build_answer_prompt(chunk, question)
 
     print("\n Answer prompt sent to model:\n", prompt[:500], "..." if len(prompt) > 500 else "")
     try:
-        result = qa_generator(prompt)
+        result = get_qa_pipeline()(prompt, **GENERATION_KWARGS)
         output = result[0]['generated_text']
         print("\nRaw answer output:\n", output)
     except Exception as e:
         print(f"Failed to generate answer: {e}")
         return ""
 
-    answer_match = re.search(r"A:\s*(.*)", output, re.IGNORECASE | re.DOTALL)
-    answer = answer_match.group(1).strip() if answer_match else output.strip()
-    return answer
+    return parse_answer(output)
 
 def save_qa_pairs_to_csv(qa_pairs: List[Dict], file_path="/data/qa_dataset.csv"):
     file_exists = os.path.isfile(file_path)
@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from final_question_creator import (
+    GENERATION_KWARGS,
+    build_answer_context,
+    build_answer_prompt,
+    build_question_prompt,
+    extract_questions_from_output,
+    make_qa_pair,
+    parse_answer,
+)
+from models import get_qa_model, get_qa_tokenizer
+from questioning.final_questioner import generate_with_shared_prefix
+
+BATCH_SIZE = 8
+NUM_QUESTIONS = 3
+QUEUE_SIZE = 64
+
+_DONE = object()
+
+
+def _batched(items: Iterable, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class QAGenerationEngine:
+    # Question generation runs in a producer thread; answers are generated in the
+    # caller's thread as questions arrive, so the two stages overlap. Both stages
+    # send prompts from many chunks through flan-t5 in batches.
+    def __init__(self, batch_size: int = BATCH_SIZE, num_questions: int = NUM_QUESTIONS,
+                 queue_size: int = QUEUE_SIZE, verbose: bool = False, shared_context: bool = False):
+        self.batch_size = batch_size
+        self.shared_context = shared_context
+        self.num_questions = num_questions
+        self.queue_size = queue_size
+        self.verbose = verbose
+        self.stats = {"chunks": 0, "fallbacks": 0, "skipped": 0, "questions": 0, "pairs": 0, "seconds": 0.0}
+        self._pipelines = {}
+
+    def _pipeline(self, stage: str):
+        # One pipeline object per stage thread, sharing the registry's weights;
+        # pipeline objects keep per-call state and are not safe to share across threads
+        if stage not in self._pipelines:
+            from transformers import pipeline
+            self._pipelines[stage] = pipeline("text2text-generation", model=get_qa_model(), tokenizer=get_qa_tokenizer())
+        return self._pipelines[stage]
+
+    def _generate(self, prompts: List[str], stage: str) -> List[str]:
+        if self.verbose:
+            for prompt in prompts:
+                print(f"\n {stage} prompt sent to model:\n", prompt[:500], "..." if len(prompt) > 500 else "")
+        try:
+            results = self._pipeline(stage)(prompts, batch_size=self.batch_size, **GENERATION_KWARGS)
+        except Exception as e:
+            print(f"Failed to generate {stage.lower()}s for a batch of {len(prompts)}: {e}")
+            return [""] * len(prompts)
+        return [result['generated_text'] for result in results]
+
+    def _question_stage(self, chunks: Iterable[Dict], handoff: queue.Queue, stop: threading.Event, errors: list):
+        try:
+            for batch in _batched(chunks, self.batch_size):
+                if stop.is_set():
+                    break
+                outputs = self._generate([build_question_prompt(c, num_questions=self.num_questions) for c in batch], "Question")
+                questions = [extract_questions_from_output(output) for output in outputs]
+
+                # Same fallback as the serial path: one simple question per empty chunk
+                retry = [i for i, qs in enumerate(questions) if not qs]
+                if retry:
+                    self.stats["fallbacks"] += len(retry)
+                    fallback = self._generate([build_question_prompt(batch[i], num_questions=1, simple_prompt=True) for i in retry], "Question")
+                    for i, output in zip(retry, fallback):
+                        questions[i] = extract_questions_from_output(output)
+
+                for chunk, qs in zip(batch, questions):
+                    handoff.put((chunk, qs))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            handoff.put(_DONE)
+
+    def _shared_context_answers(self, pending):
+        # Each chunk's text is encoded once for all of its questions
+        tokenizer = get_qa_tokenizer()
+        jobs, outputs = [], []
+        for chunk, questions in pending:
+            if not questions:
+                continue
+            prefix = tokenizer(build_answer_context(chunk), add_special_tokens=False)['input_ids']
+            suffixes = [
+                tokenizer(f"\n\nQ: {q}\nA:", add_special_tokens=False)['input_ids'] + [tokenizer.eos_token_id]
+                for q in questions
+            ]
+            try:
+                outputs.extend(generate_with_shared_prefix(prefix, suffixes, **GENERATION_KWARGS))
+            except Exception as e:
+                print(f"Failed to generate answers for a chunk: {e}")
+                outputs.extend([""] * len(questions))
+            jobs.extend((chunk, q, None) for q in questions)
+        return jobs, outputs
+
+    def _answer_stage(self, pending):
+        if self.shared_context:
+            jobs, outputs = self._shared_context_answers(pending)
+        else:
+            jobs = []
+            for chunk, questions in pending:
+                context = build_answer_context(chunk)
+                jobs.extend((chunk, q, build_answer_prompt(chunk, q, context=context)) for q in questions)
+            outputs = self._generate([prompt for _, _, prompt in jobs], "Answer") if jobs else []
+
+        pairs = {id(chunk): [] for chunk, _ in pending}
+        for (chunk, question, _), output in zip(jobs, outputs):
+            answer = parse_answer(output) if output else ""
+            if answer:
+                pairs[id(chunk)].append(make_qa_pair(chunk, question, answer))
+
+        for chunk, questions in pending:
+            self.stats["chunks"] += 1
+            self.stats["questions"] += len(questions)
+            self.stats["pairs"] += len(pairs[id(chunk)])
+            if not questions:
+                self.stats["skipped"] += 1
+            yield chunk, pairs[id(chunk)]
+
+    def run(self, chunks: Iterable[Dict]):
+        # Yields (chunk, qa_pairs) for every chunk as soon as its answers are ready
+        handoff = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        producer = threading.Thread(
+            target=self._question_stage, args=(chunks, handoff, stop, errors), name="qa-questions", daemon=True
+        )
+        start = time.perf_counter()
+        producer.start()
+
+        try:
+            pending = []
+            done = False
+            while not done:
+                item = handoff.get()
+                if item is _DONE:
+                    done = True
+                else:
+                    pending.append(item)
+                if done or sum(len(qs) for _, qs in pending) >= self.batch_size:
+                    yield from self._answer_stage(pending)
+                    pending = []
+        finally:
+            stop.set()
+            # Unblock the producer if the consumer stopped early
+            while producer.is_alive():
+                try:
+                    handoff.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.stats["seconds"] += time.perf_counter() - start
+
+        if errors:
+            raise errors[0]
+
+    def pairs_per_second(self) -> float:
+        return self.stats["pairs"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+
+    def report(self):
+        s = self.stats
+        print(f" Generated {s['pairs']} QA pairs from {s['chunks']} chunks "
+              f"({s['questions']} questions, {s['fallbacks']} fallbacks, {s['skipped']} skipped) "
+              f"in {s['seconds']:.1f}s: {self.pairs_per_second():.2f} pairs/s")
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import os
 
@@ -5,61 +6,58 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 sys.path.append(project_root)
 
 from scraping.final_scraper import scrape_fandom_page
+from scraping.crawler import crawl_wiki
 from summarization.final_summarizer import summarize_chunks
-from questioning.final_questioner import generate_questions, generate_answer, save_qa_pairs_to_csv, save_qa_pairs_to_excel, clean_section, clean_context
+from dataset_writer import QADatasetWriter
+from generation_engine import BATCH_SIZE, QAGenerationEngine
 
 CSV_FILE = "/data/qa_dataset.csv"
 XLSX_FILE = "/data/qa_dataset.xlsx"
+JSONL_FILE = "/data/qa_dataset.jsonl"
 
-def run_pipeline(url):
-    print(f"\n Scraping data from: {url}")
-    data = scrape_fandom_page(url)
-    chunks = data['chunks']
-    print(f" Loaded {len(chunks)} chunks from: {data['title']}")
+def process_page(data, engine, writer):
+    chunks = writer.pending(data['chunks'])
+    print(f" Loaded {len(data['chunks'])} chunks from: {data['title']} ({len(chunks)} not processed yet)")
+    if not chunks:
+        return
 
     print("\n Summarizing chunks...")
     summary = summarize_chunks(chunks)
     print("\n Summary:\n", summary)
 
     print("\n Generating QA pairs...")
-
-    for i, chunk in enumerate(chunks):
-        print(f"\n Processing chunk {i + 1}/{len(chunks)}")
-        print("📏 Chunk preview:\n", chunk['text'][:300], "..." if len(chunk['text']) > 300 else "")
-
-        questions = generate_questions(chunk, num_questions=3)
-
-        if not questions:
-            print(" No questions generated for this chunk. Trying a fallback prompt...")
-            questions = generate_questions(chunk, num_questions=1, simple_prompt=True)
-
-            if not questions:
-                print(" Still no questions generated after fallback. Skipping this chunk.")
-                continue
-            else:
-                print(f" Fallback generated {len(questions)} question(s).")
-
-        qa_pairs = []
-        for q in questions:
-            a = generate_answer(chunk, q)
-            if not a:
-                print(f" No answer generated for question: {q}")
-                continue
-            qa_pairs.append({
-                "question": q,
-                "answer": a,
-                "section": clean_section(chunk.get("section", "")),
-                "context": clean_context(chunk["text"])
-            })
-
-        if qa_pairs:
-            save_qa_pairs_to_csv(qa_pairs, file_path=CSV_FILE)
-            save_qa_pairs_to_excel(qa_pairs, file_path=XLSX_FILE)
-            print(f" Saved {len(qa_pairs)} QA pairs.")
-        else:
-            print(" No valid QA pairs to save for this chunk.")
-
-    print(f"\n Done! QA pairs saved to {CSV_FILE} and {XLSX_FILE}")
+    for chunk, qa_pairs in engine.run(chunks):
+        if not qa_pairs:
+            print(f" No valid QA pairs for a chunk in section: {chunk.get('section', 'Unknown')}")
+        writer.write(chunk, qa_pairs)
+    writer.flush()
+    engine.report()
+
+def run_pipeline(url, max_pages=1, max_depth=1, batch_size=BATCH_SIZE, verbose=False, shared_context=False):
+    engine = QAGenerationEngine(batch_size=batch_size, verbose=verbose, shared_context=shared_context)
+    if max_pages <= 1:
+        print(f"\n Scraping data from: {url}")
+        pages = [scrape_fandom_page(url)]
+    else:
+        print(f"\n Crawling up to {max_pages} pages from: {url}")
+        pages = crawl_wiki(url, max_pages=max_pages, max_depth=max_depth)
+
+    # Existing CSV rows seed the JSONL on the first run so the export keeps them
+    with QADatasetWriter(JSONL_FILE, seed_csv=CSV_FILE) as writer:
+        for data in pages:
+            process_page(data, engine, writer)
+
+        count = writer.export(csv_path=CSV_FILE, xlsx_path=XLSX_FILE)
+    print(f"\n Done! {count} QA pairs saved to {JSONL_FILE}, {CSV_FILE} and {XLSX_FILE}")
 
 if __name__ == "__main__":
-    run_pipeline("https://naruto.fandom.com/wiki/Hinata_Hyūga")
+    parser = argparse.ArgumentParser(description="Generate QA pairs from fandom wiki pages.")
+    parser.add_argument("url", nargs="?", default="https://naruto.fandom.com/wiki/Hinata_Hyūga")
+    parser.add_argument("--max-pages", type=int, default=1, help="Crawl in-wiki links up to this many pages.")
+    parser.add_argument("--max-depth", type=int, default=1, help="Link depth to follow when crawling.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Prompts per flan-t5 batch.")
+    parser.add_argument("--verbose", action="store_true", help="Print every prompt sent to the model.")
+    parser.add_argument("--shared-context", action="store_true", help="Encode each chunk once for all of its questions.")
+    args = parser.parse_args()
+    run_pipeline(args.url, max_pages=args.max_pages, max_depth=args.max_depth, batch_size=args.batch_size,
+                 verbose=args.verbose, shared_context=args.shared_context)
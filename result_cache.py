@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import CACHE_DIR
+
+RESULT_CACHE_PATH = os.path.join(CACHE_DIR, "results.sqlite3")
+RESULT_TTL_SECONDS = int(os.environ.get("ANIME_RESULT_TTL", str(7 * 24 * 3600)))
+MAX_RESULTS = int(os.environ.get("ANIME_RESULT_CACHE_ENTRIES", "10000"))
+SEMANTIC_THRESHOLD = float(os.environ.get("ANIME_SEMANTIC_THRESHOLD", "0.9"))
+SEMANTIC_MAX_PAGES = 64
+SEMANTIC_MAX_PER_PAGE = 256
+
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def chunk_id(chunk) -> str:
+    return hashlib.sha256(f"{chunk.get('section', '')}\0{chunk['text']}".encode("utf-8")).hexdigest()[:16]
+
+
+def content_fingerprint(chunks) -> str:
+    # Changes whenever the scraped content changes, which invalidates every key built on it
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk_id(chunk).encode("ascii"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Persistent namespace/key -> JSON value store with TTL expiry and LRU size eviction
+    def __init__(self, path: str = RESULT_CACHE_PATH, ttl: float = RESULT_TTL_SECONDS, max_entries: int = MAX_RESULTS):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def get(self, namespace: str, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM results WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE namespace = ? AND key = ?", (namespace, key))
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl:
+            self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM results")
+            else:
+                self._conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+
+class SemanticAnswerCache:
+    # Per-page store of normalized question embeddings. A new question reuses a
+    # stored answer when it is close enough to an earlier question on the same
+    # page and retrieved the same chunks.
+    def __init__(self, threshold: float = SEMANTIC_THRESHOLD, max_pages: int = SEMANTIC_MAX_PAGES,
+                 max_per_page: int = SEMANTIC_MAX_PER_PAGE):
+        self.threshold = threshold
+        self.max_pages = max_pages
+        self.max_per_page = max_per_page
+        self.lookups = 0
+        self.hits = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, page: str, embedding, chunk_ids):
+        key = frozenset(chunk_ids)
+        with self._lock:
+            self.lookups += 1
+            entry = self._pages.get(page)
+            if entry is None:
+                return None
+            self._pages.move_to_end(page)
+            scores = entry["embeddings"] @ np.asarray(embedding, dtype=np.float32)
+            for i in np.argsort(-scores):
+                if scores[i] < self.threshold:
+                    break
+                if entry["chunks"][i] == key:
+                    self.hits += 1
+                    return entry["answers"][i]
+        return None
+
+    def add(self, page: str, embedding, chunk_ids, answer: str):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            entry = self._pages.get(page)
+            if entry is None:
+                entry = {"embeddings": np.zeros((0, vector.shape[1]), dtype=np.float32), "chunks": [], "answers": []}
+                self._pages[page] = entry
+            self._pages.move_to_end(page)
+            entry["embeddings"] = np.vstack([entry["embeddings"], vector])[-self.max_per_page:]
+            entry["chunks"] = (entry["chunks"] + [frozenset(chunk_ids)])[-self.max_per_page:]
+            entry["answers"] = (entry["answers"] + [answer])[-self.max_per_page:]
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "pages": len(self._pages),
+                "entries": sum(len(entry["answers"]) for entry in self._pages.values()),
+            }
+
+
+_default_cache = None
+_default_semantic_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+    return _default_cache
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    global _default_semantic_cache
+    with _default_cache_lock:
+        if _default_semantic_cache is None:
+            _default_semantic_cache = SemanticAnswerCache()
+    return _default_semantic_cache
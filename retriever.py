@@ -1,21 +1,185 @@
-from sentence_transformers import SentenceTransformer
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+from embeddings import embed_chunks
+from lexical_index import BM25Index
+from models import get_embedder, in_use
+from result_cache import content_fingerprint
+from tracing import span
+from vector_index import build_index, load_index, save_index
+
+# numpy (exact, default), numpy-fp16, faiss, faiss-ivf or faiss-hnsw
+INDEX_BACKEND = os.environ.get("ANIME_INDEX_BACKEND", "numpy")
+# dense scores every chunk; hybrid takes BM25's top candidates and reranks
+# only those with the dense embeddings
+RETRIEVAL_MODE = os.environ.get("ANIME_RETRIEVAL_MODE", "dense")
+# How hybrid ranks candidates: rrf (reciprocal rank fusion), linear
+# (FUSION_ALPHA * cosine + (1 - FUSION_ALPHA) * max-normalized BM25) or dense
+FUSION = os.environ.get("ANIME_FUSION", "rrf")
+FUSION_ALPHA = float(os.environ.get("ANIME_FUSION_ALPHA", "0.5"))
+HYBRID_CANDIDATES = int(os.environ.get("ANIME_HYBRID_CANDIDATES", "100"))
+RRF_K = 60
+RETRIEVAL_MODES = ("dense", "hybrid")
+FUSIONS = ("rrf", "linear", "dense")
 
 class Retriever:
-    def __init__(self, chunks):
-        self.chunks = chunks
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.embeddings = self.model.encode([chunk['text'] for chunk in chunks], convert_to_tensor=True)
-
-    # def query(self, q, top_k=3):
-    #     query_embedding = self.model.encode(q, convert_to_tensor=True)
-    #     scores = cosine_similarity([query_embedding.cpu().numpy()], self.embeddings.cpu().numpy())[0]
-    #     top_indices = np.argsort(scores)[::-1][:top_k]
-    #     return [self.chunks[i]['text'] for i in top_indices]
-    
-    def query(self, q, top_k=3):
-        query_embedding = self.model.encode(q, convert_to_tensor=True)
-        scores = cosine_similarity([query_embedding.cpu().numpy()], self.embeddings.cpu().numpy())[0]
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        return [self.chunks[i] for i in top_indices]
+    def __init__(self, chunks, backend=INDEX_BACKEND, mode=RETRIEVAL_MODE, fusion=FUSION,
+                 candidates=HYBRID_CANDIDATES, alpha=FUSION_ALPHA, **index_kwargs):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Choose from: {', '.join(RETRIEVAL_MODES)}")
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}'. Choose from: {', '.join(FUSIONS)}")
+        self.mode = mode
+        self.fusion = fusion
+        self.candidates = candidates
+        self.alpha = alpha
+        # Accepts raw chunks or an EmbeddedChunks shared with the summarizer
+        embedded = embed_chunks(chunks)
+        self.chunks = embedded.chunks
+        # Looked up per call, so the memory manager can unload the model
+        self.model_name = embedded.model_name
+        self.backend = backend
+        with span("index_build", backend=backend, chunks=len(self.chunks)):
+            self.index = build_index(embedded.embeddings, backend, **index_kwargs)
+        self.lexical = self._build_lexical(self.chunks)
+        # Identifies the page content for result caches
+        self.fingerprint = content_fingerprint(self.chunks)
+        self.last_used = time.monotonic()
+        self._spill_path = None
+        self._spill_cleanup = None
+        self._lock = threading.Lock()
+
+    def _build_lexical(self, chunks):
+        if self.mode != "hybrid":
+            return None
+        with span("lexical_build", chunks=len(chunks)):
+            return BM25Index([chunk["text"] for chunk in chunks])
+
+    @property
+    def resident(self):
+        return self.index is not None
+
+    @property
+    def nbytes(self):
+        # Index plus chunk texts and token ids; 0 once spilled to disk
+        if self.index is None:
+            return 0
+        text = sum(len(chunk["text"]) + 8 * len(chunk.get("token_ids", ())) for chunk in self.chunks)
+        return self.index.nbytes + text + (self.lexical.nbytes if self.lexical is not None else 0)
+
+    def _spill_key(self):
+        # The same page indexed with another backend, FAISS kind or dtype
+        # is a different index on disk
+        matrix = getattr(self.index, "matrix", None)
+        dtype = matrix.dtype if matrix is not None else "float32"
+        return f"{self.fingerprint}-{self.backend}-{getattr(self.index, 'kind', 'exact')}-{dtype}"
+
+    def spill(self, directory):
+        # Writes the index and chunks to disk and drops them from memory; the
+        # next query reloads them (the numpy index comes back memory-mapped)
+        with self._lock:
+            if self.index is None:
+                return
+            if self._spill_path is None:
+                # A directory of its own, so removing it never takes files
+                # another retriever or process still maps
+                os.makedirs(directory, exist_ok=True)
+                self._spill_path = tempfile.mkdtemp(prefix=f"{self._spill_key()}-", dir=directory)
+                # Removed once this retriever is freed, at the latest at exit
+                self._spill_cleanup = weakref.finalize(self, shutil.rmtree, self._spill_path, True)
+                save_index(self.index, self._spill_path)
+            # else the index came back memory-mapped from _spill_path and is already on disk
+            with open(os.path.join(self._spill_path, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(self.chunks, f)
+            self.index = None
+            self.lexical = None
+            self.chunks = None
+
+    def _resident(self):
+        self.last_used = time.monotonic()
+        with self._lock:
+            if self.index is None:
+                with span("index_reload", path=self._spill_path):
+                    chunks_path = os.path.join(self._spill_path, "chunks.json")
+                    with open(chunks_path, encoding="utf-8") as f:
+                        self.chunks = json.load(f)
+                    os.remove(chunks_path)
+                    self.index = load_index(self._spill_path)
+                    self.lexical = self._build_lexical(self.chunks)
+                if not isinstance(getattr(self.index, "matrix", None), np.memmap):
+                    # Fully back in memory: the spilled files are no longer needed
+                    self._spill_cleanup()
+                    self._spill_path = None
+            return self.index, self.lexical, self.chunks
+
+    def encode_queries(self, questions):
+        with in_use(self.model_name):
+            return np.asarray(get_embedder(self.model_name).encode(questions, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32)
+
+    def search(self, query_embeddings, top_k=3):
+        index, _, _ = self._resident()
+        return index.search(query_embeddings, top_k)
+
+    def _search(self, index, lexical, questions, embeddings, top_k):
+        if lexical is None:
+            return index.search(embeddings, top_k)
+
+        scores = np.full((len(questions), top_k), -np.inf, dtype=np.float32)
+        indices = np.full((len(questions), top_k), -1, dtype=np.int64)
+        for row, (question, embedding) in enumerate(zip(questions, embeddings)):
+            bm25, candidates = lexical.search(question, max(self.candidates, top_k))
+            if len(candidates) < top_k:
+                # Too little lexical evidence to prefilter: fall back to dense over everything
+                row_scores, row_indices = index.search(embedding[None, :], top_k)
+                scores[row, :row_scores.shape[1]] = row_scores[0]
+                indices[row, :row_indices.shape[1]] = row_indices[0]
+                continue
+
+            dense = index.vectors(candidates) @ embedding
+            if self.fusion == "dense":
+                fused = dense
+            elif self.fusion == "linear":
+                fused = self.alpha * dense + (1 - self.alpha) * bm25 / bm25[0]
+            else:
+                # candidates arrive in BM25 order, so their lexical rank is their position
+                dense_rank = np.empty(len(dense), dtype=np.int64)
+                dense_rank[np.argsort(-dense, kind="stable")] = np.arange(len(dense))
+                fused = 1.0 / (RRF_K + 1 + dense_rank) + 1.0 / (RRF_K + 1 + np.arange(len(dense)))
+            order = np.argsort(-fused, kind="stable")[:top_k]
+            # Hits carry the cosine similarity, the scale prompt packing weights by
+            scores[row, :len(order)] = dense[order]
+            indices[row, :len(order)] = candidates[order]
+        return scores, indices
+
+    @staticmethod
+    def _hits(chunks, scores, indices, return_scores):
+        if return_scores:
+            return [(chunks[i], float(s)) for s, i in zip(scores, indices) if i >= 0]
+        return [chunks[i] for i in indices if i >= 0]
+
+    def query(self, q, top_k=3, return_scores=False, return_embedding=False):
+        with span("retrieve", questions=1, top_k=top_k, mode=self.mode):
+            index, lexical, chunks = self._resident()
+            embeddings = self.encode_queries([q])
+            scores, indices = self._search(index, lexical, [q], embeddings, top_k)
+        hits = self._hits(chunks, scores[0], indices[0], return_scores)
+        return (hits, embeddings[0]) if return_embedding else hits
+
+    def query_many(self, questions, top_k=3, return_scores=False, return_embeddings=False):
+        # One encode batch and one matrix product for every question
+        questions = list(questions)
+        if not questions:
+            return ([], np.zeros((0, 0), dtype=np.float32)) if return_embeddings else []
+        with span("retrieve", questions=len(questions), top_k=top_k, mode=self.mode):
+            index, lexical, chunks = self._resident()
+            embeddings = self.encode_queries(questions)
+            scores, indices = self._search(index, lexical, questions, embeddings, top_k)
+        hits = [self._hits(chunks, s, i, return_scores) for s, i in zip(scores, indices)]
+        return (hits, embeddings) if return_embeddings else hits
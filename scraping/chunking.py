@@ -0,0 +1,85 @@
+from typing import List
+
+# Three retrieved windows plus the prompt and question fit MAX_INPUT_TOKENS (480)
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP = 32
+
+
+def _starts_word(text, offsets, i):
+    char_start = offsets[i][0]
+    return char_start == 0 or text[char_start - 1].isspace()
+
+
+def _word_start(text, offsets, index, limit):
+    # Move a window start forward to the first token that begins a word
+    for i in range(index, min(limit, len(offsets))):
+        if _starts_word(text, offsets, i):
+            return i
+    return index
+
+
+def _word_end(text, offsets, index, limit):
+    # Move a window end back so the window does not stop mid-word
+    for i in range(index, limit, -1):
+        if _starts_word(text, offsets, i):
+            return i
+    return index
+
+
+def split_chunk(chunk: dict, tokenizer, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> List[dict]:
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+
+    text = chunk["text"]
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    ids = encoding["input_ids"]
+    offsets = encoding["offset_mapping"]
+
+    if len(ids) <= max_tokens:
+        return [dict(chunk, window=0, start=0, end=len(text), token_count=len(ids), token_ids=ids)]
+
+    # Windows are slices of the original text, so nothing is decoded back from tokens.
+    # token_ids are kept so prompts can be packed without tokenizing the chunk again.
+    windows = []
+    start = 0
+    while True:
+        end = min(start + max_tokens, len(ids))
+        if end < len(ids):
+            end = _word_end(text, offsets, end, start + max_tokens - overlap)
+        char_start, char_end = offsets[start][0], offsets[end - 1][1]
+        windows.append(dict(
+            chunk,
+            text=text[char_start:char_end].strip(),
+            window=len(windows),
+            start=char_start,
+            end=char_end,
+            token_count=end - start,
+            token_ids=ids[start:end],
+        ))
+        if end == len(ids):
+            return windows
+        next_start = max(end - overlap, start + 1)
+        start = _word_start(text, offsets, next_start, end)
+
+
+def chunk_sections(chunks: List[dict], tokenizer=None, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> List[dict]:
+    # Token counts are measured with the flan-t5 tokenizer that builds the answer prompts
+    if tokenizer is None:
+        from models import get_qa_tokenizer
+        tokenizer = get_qa_tokenizer()
+
+    windows = []
+    for chunk in chunks:
+        windows.extend(split_chunk(chunk, tokenizer, max_tokens=max_tokens, overlap=overlap))
+    return windows
+
+
+def tokenize_chunks(chunks: List[dict], tokenizer) -> List[dict]:
+    # Fills token_ids for chunks that did not come through split_chunk, in one batch
+    missing = [chunk for chunk in chunks if "token_ids" not in chunk]
+    if missing:
+        encoded = tokenizer([chunk["text"] for chunk in missing], add_special_tokens=False)["input_ids"]
+        for chunk, ids in zip(missing, encoded):
+            chunk["token_ids"] = ids
+            chunk.setdefault("token_count", len(ids))
+    return chunks
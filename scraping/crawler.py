@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from scraping.fetcher import get_session
+from scraping.final_scraper import canonicalize_url, scrape_fandom_page
+
+MAX_PAGES = 50
+MAX_DEPTH = 2
+MAX_WORKERS = 8
+PER_HOST_CONCURRENCY = 4
+REQUESTS_PER_SECOND = 2.0
+
+
+class HostLimiter:
+    # Caps in-flight requests per host and spaces request starts per host
+    def __init__(self, concurrency=PER_HOST_CONCURRENCY, requests_per_second=REQUESTS_PER_SECOND):
+        self.concurrency = concurrency
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._semaphores = {}
+        self._next_start = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, host):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.concurrency))
+        semaphore.acquire()
+        try:
+            if self.min_interval:
+                with self._lock:
+                    now = time.monotonic()
+                    start = max(now, self._next_start.get(host, now))
+                    self._next_start[host] = start + self.min_interval
+                time.sleep(max(0.0, start - now))
+            yield
+        finally:
+            semaphore.release()
+
+
+def crawl_wiki(start_urls, max_pages=MAX_PAGES, max_depth=MAX_DEPTH, max_workers=MAX_WORKERS,
+               per_host_concurrency=PER_HOST_CONCURRENCY, requests_per_second=REQUESTS_PER_SECOND,
+               session=None, use_cache=True):
+    # Yields scrape_fandom_page results as soon as each page finishes
+    if isinstance(start_urls, str):
+        start_urls = [start_urls]
+    session = session or get_session()
+    limiter = HostLimiter(per_host_concurrency, requests_per_second)
+    seen = set()
+    pending = {}
+
+    def fetch(url):
+        with limiter.slot(urlsplit(url).netloc):
+            return scrape_fandom_page(url, session=session, use_cache=use_cache)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawler")
+
+    def submit(url, depth):
+        if url in seen or len(seen) >= max_pages:
+            return
+        seen.add(url)
+        pending[pool.submit(fetch, url)] = (url, depth)
+
+    try:
+        for url in start_urls:
+            submit(canonicalize_url(url), 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, depth = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"Failed to crawl {url}: {e}")
+                    continue
+                if depth < max_depth:
+                    for link in data.get('links', []):
+                        submit(link, depth + 1)
+                data['depth'] = depth
+                yield data
+    finally:
+        # Stop quickly if the consumer stops iterating early
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def crawl_chunks(start_urls, **crawl_kwargs):
+    for page in crawl_wiki(start_urls, **crawl_kwargs):
+        for chunk in page['chunks']:
+            yield dict(chunk, url=page['url'], title=page['title'])
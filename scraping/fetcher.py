@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CACHE_DIR = os.environ.get(
+    "ANIME_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+)
+PAGE_CACHE_DIR = os.path.join(CACHE_DIR, "pages")
+
+REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 10
+USER_AGENT = "anime-llm-assistant/1.0 (+https://github.com/Jesse489617/Data-Driven-Innovation-Challenge)"
+
+
+def create_session(retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, pool_size=POOL_SIZE):
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    # Raw HTML plus validators per URL, and parsed chunks per HTML content hash
+    def __init__(self, cache_dir: str = PAGE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.parsed_dir = os.path.join(cache_dir, "parsed")
+        os.makedirs(self.parsed_dir, exist_ok=True)
+
+    def _page_paths(self, url):
+        key = content_hash(url)
+        return os.path.join(self.cache_dir, f"{key}.html"), os.path.join(self.cache_dir, f"{key}.json")
+
+    @staticmethod
+    def _write(path, text):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def load(self, url):
+        html_path, meta_path = self._page_paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(html_path, encoding="utf-8") as f:
+                return f.read(), meta
+        except (OSError, ValueError):
+            return None, {}
+
+    def store(self, url, html, meta):
+        html_path, meta_path = self._page_paths(url)
+        self._write(html_path, html)
+        self._write(meta_path, json.dumps(meta))
+
+    def load_parsed(self, key):
+        try:
+            with open(os.path.join(self.parsed_dir, f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store_parsed(self, key, data):
+        self._write(os.path.join(self.parsed_dir, f"{key}.json"), json.dumps(data, ensure_ascii=False))
+
+
+_session = None
+_page_cache = None
+_defaults_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _defaults_lock:
+        if _session is None:
+            _session = create_session()
+    return _session
+
+
+def get_page_cache():
+    global _page_cache
+    with _defaults_lock:
+        if _page_cache is None:
+            _page_cache = PageCache()
+    return _page_cache
+
+
+def fetch_page(url, session=None, timeout=REQUEST_TIMEOUT, use_cache=True):
+    session = session or get_session()
+    cache = get_page_cache() if use_cache else None
+
+    cached_html, meta = cache.load(url) if cache else (None, {})
+    headers = {}
+    if cached_html is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached_html is not None:
+        return {"url": url, "html": cached_html, "content_hash": meta["content_hash"], "from_cache": True}
+    if not response.ok:
+        raise Exception(f"Failed to fetch page: {url}")
+
+    html = response.text
+    page = {"url": url, "html": html, "content_hash": content_hash(html), "from_cache": False}
+    if cache:
+        cache.store(url, html, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": page["content_hash"],
+            "fetched_at": time.time(),
+        })
+    return page
@@ -1,44 +1,168 @@
-import requests
+import os
+from urllib.parse import quote, unquote, urljoin, urlsplit, urlunsplit
+
 from bs4 import BeautifulSoup
 
-def scrape_fandom_page(url):
-    response = requests.get(url)
-    if not response.ok:
-        raise Exception(f"Failed to fetch page: {url}")
+from scraping.fetcher import fetch_page, get_page_cache
+from tracing import span
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    title = soup.find('h1').text.strip()
+# Bump when the parsing output changes so cached chunks are not reused
+PARSE_CACHE_VERSION = 3
 
-    content_div = soup.find('div', {'class': 'mw-parser-output'})
-    if not content_div:
-        raise Exception("Could not find the content container.")
+def canonicalize_url(url):
+    scheme, netloc, path, _, _ = urlsplit(url)
+    path = unquote(path).replace(" ", "_").rstrip("/") or "/"
+    return urlunsplit(("https" if scheme in ("http", "https") else scheme, netloc.lower(), quote(path, safe="/:@!$&'()*+,;=-._~"), "", ""))
+
+def extract_wiki_links(hrefs, url):
+    # Article links only: same host, under /wiki/, no namespaces like File: or Category:
+    host = urlsplit(url).netloc.lower()
+    links = []
+    seen = set()
+    for href in hrefs:
+        parts = urlsplit(urljoin(url, href))
+        if parts.netloc.lower() != host or parts.query or not parts.path.startswith("/wiki/"):
+            continue
+        if ":" in unquote(parts.path[len("/wiki/"):]):
+            continue
+        link = canonicalize_url(urlunsplit(parts))
+        if link not in seen:
+            seen.add(link)
+            links.append(link)
+    return links
 
+def group_sections(tags):
+    # tags: (name, stripped text) pairs for h2/h3/p in document order
     chunks = []
     current_chunk = []
     current_section_title = "Introduction"
+    current_parent = None
+    current_h2 = None
 
-    for tag in content_div.find_all(['h2', 'h3', 'p']):
-        if tag.name in ['h2', 'h3']:
+    for name, text in tags:
+        if name in ['h2', 'h3']:
             if current_chunk:
                 chunks.append({
                     "section": current_section_title,
+                    "parent_section": current_parent,
                     "text": " ".join(current_chunk)
                 })
                 current_chunk = []
-            current_section_title = tag.get_text(strip=True)
-        elif tag.name == 'p':
-            text = tag.get_text(strip=True)
+            current_section_title = text
+            if name == 'h2':
+                current_h2 = text
+                current_parent = None
+            else:
+                current_parent = current_h2
+        elif name == 'p':
             if text:
                 current_chunk.append(text)
 
     if current_chunk:
         chunks.append({
             "section": current_section_title,
+            "parent_section": current_parent,
             "text": " ".join(current_chunk)
         })
+    return chunks
+
+# Elements whose text is code or inert markup; BeautifulSoup's get_text skips them
+NON_TEXT_TAGS = ('script', 'style', 'template')
+NON_TEXT_XPATH = ' or '.join(f'ancestor::{tag}' for tag in NON_TEXT_TAGS)
+
+def _parse_with_soup(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('h1').text.strip()
+
+    content_div = soup.find('div', {'class': 'mw-parser-output'})
+    if not content_div:
+        raise Exception("Could not find the content container.")
+
+    tags = ((tag.name, tag.get_text(strip=True)) for tag in content_div.find_all(['h2', 'h3', 'p']))
+    hrefs = [a['href'] for a in content_div.find_all('a', href=True)]
+    return title, group_sections(tags), hrefs
+
+def _parse_with_lxml(html):
+    import lxml.html
+
+    root = lxml.html.fromstring(html.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+    title = root.xpath('//h1')[0].text_content().strip()
+
+    found = root.xpath('//div[contains(concat(" ", normalize-space(@class), " "), " mw-parser-output ")]')
+    if not found:
+        raise Exception("Could not find the content container.")
+    content_div = found[0]
+
+    # Same text rules as get_text(strip=True): strip every text node, drop empty ones, join with ""
+    tags = (
+        (el.tag, "".join(s.strip() for s in el.xpath(f'.//text()[not({NON_TEXT_XPATH})]')))
+        for el in content_div.iter('h2', 'h3', 'p')
+    )
+    hrefs = content_div.xpath('.//a/@href')
+    return title, group_sections(tags), hrefs
+
+def _parse_with_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    title = tree.css_first('h1').text(deep=True, separator='', strip=False).strip()
+
+    content_div = tree.css_first('div.mw-parser-output')
+    if content_div is None:
+        raise Exception("Could not find the content container.")
+
+    hrefs = [a.attributes['href'] for a in content_div.css('a') if a.attributes.get('href') is not None]
+    # text(deep=True) would include script and style source, which get_text leaves out
+    content_div.strip_tags(list(NON_TEXT_TAGS))
+    tags = (
+        (node.tag, node.text(deep=True, separator='', strip=True))
+        for node in content_div.traverse()
+        if node.tag in ('h2', 'h3', 'p')
+    )
+    chunks = group_sections(tags)
+    return title, chunks, hrefs
+
+# The backends produce identical chunks for well-formed HTML only. Where a
+# block element sits inside a <p> (which templates sometimes emit), lxml and
+# selectolax close the paragraph early the way browsers do, while
+# html.parser keeps the nested text in it. html.parser stays the default so
+# cached chunks and the QA dataset keep matching; see benchmarks/bench_parsers.py
+PARSER_BACKENDS = {
+    "html.parser": _parse_with_soup,
+    "lxml": _parse_with_lxml,
+    "selectolax": _parse_with_selectolax,
+}
+HTML_PARSER = os.environ.get("ANIME_HTML_PARSER", "html.parser")
+
+def parse_fandom_html(html, url, parser=HTML_PARSER):
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown HTML parser '{parser}'. Choose from: {', '.join(PARSER_BACKENDS)}")
+    title, chunks, hrefs = PARSER_BACKENDS[parser](html)
 
     return {
         'title': title,
         'url': url,
-        'chunks': chunks  
+        'chunks': chunks,
+        'links': extract_wiki_links(hrefs, url)
     }
+
+def scrape_fandom_page(url, session=None, use_cache=True):
+    with span("fetch", url=url) as s:
+        page = fetch_page(url, session=session, use_cache=use_cache)
+        s.set(from_cache=page['from_cache'], bytes=len(page['html']))
+
+    # An unchanged page (same HTML) skips parsing entirely
+    cache = get_page_cache() if use_cache else None
+    parsed_key = f"{page['content_hash']}-v{PARSE_CACHE_VERSION}"
+    if cache:
+        data = cache.load_parsed(parsed_key)
+        if data is not None:
+            data['url'] = url
+            return data
+
+    with span("parse", parser=HTML_PARSER) as s:
+        data = parse_fandom_html(page['html'], url)
+        s.set(chunks=len(data['chunks']))
+    if cache:
+        cache.store_parsed(parsed_key, data)
+    return data
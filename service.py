@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from aiohttp import web
+
+import tracing
+from batching import MicroBatcher, QueueFull
+from models import warm_up
+from pipeline import IngestJob, ask_questions
+
+REQUEST_TIMEOUT = float(os.environ.get("ANIME_REQUEST_TIMEOUT", "30"))
+SERVICE_HOST = os.environ.get("ANIME_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("ANIME_SERVICE_PORT", "8080"))
+
+# MicroBatcher.report() field -> Prometheus type and help text
+BATCHER_METRICS = {
+    "requests": ("counter", "Questions accepted into the batch queue."),
+    "batches": ("counter", "Batches handed to the model."),
+    "batched_items": ("counter", "Questions answered in batches."),
+    "rejected": ("counter", "Questions rejected because the queue was full."),
+    "timeouts": ("counter", "Questions whose caller stopped waiting."),
+    "errors": ("counter", "Batches that raised an error."),
+    "queued": ("gauge", "Questions waiting in the queue."),
+    "mean_batch_size": ("gauge", "Mean questions per batch since start."),
+    "max_batch_size": ("gauge", "Configured largest batch."),
+    "max_wait_ms": ("gauge", "Configured wait for a batch to fill, in milliseconds."),
+}
+
+
+class JobStore:
+    # url -> IngestJob, shared by every client; failed jobs are retried on the next ingest
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def ingest(self, url):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is None or job.status == "failed":
+                job = self.jobs[url] = IngestJob(url).start()
+        return job
+
+    def get(self, url):
+        return self.jobs.get(url)
+
+
+def answer_batch(items, use_cache=True):
+    # items: (question, retriever) pairs; one batched retrieval and generation per page
+    groups = OrderedDict()
+    for i, (question, retriever) in enumerate(items):
+        groups.setdefault(id(retriever), (retriever, []))[1].append(i)
+    answers = [None] * len(items)
+    for retriever, indices in groups.values():
+        questions = [items[i][0] for i in indices]
+        for i, answer in zip(indices, ask_questions(questions, retriever, batch_size=len(questions), use_cache=use_cache)):
+            answers[i] = answer
+    return answers
+
+
+def _job_status(job):
+    return {
+        "url": job.url,
+        "status": job.status,
+        "chunks": job.chunks,
+        "indexed": job.retriever is not None,
+        "error": job.error,
+    }
+
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Body must be a JSON object")
+    return body
+
+
+def _timeout(value):
+    # Seconds the caller will wait; REQUEST_TIMEOUT when not given, and never
+    # more than that, so a longer request is refused rather than cut short
+    if value is None:
+        return REQUEST_TIMEOUT
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text="timeout must be a number of seconds")
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise web.HTTPBadRequest(text="timeout must be a positive number of seconds")
+    if timeout > REQUEST_TIMEOUT:
+        raise web.HTTPBadRequest(text=f"timeout must be at most {REQUEST_TIMEOUT:g} seconds")
+    return timeout
+
+
+def _job_or_404(request, url):
+    if not url or not isinstance(url, str):
+        raise web.HTTPBadRequest(text="Missing url")
+    job = request.app["jobs"].get(url)
+    if job is None:
+        raise web.HTTPNotFound(text=f"{url} has not been ingested; POST /ingest first")
+    return job
+
+
+async def handle_ingest(request):
+    body = await _read_json(request)
+    url = body.get("url")
+    if not url or not isinstance(url, str):
+        raise web.HTTPBadRequest(text="Missing url")
+    job = request.app["jobs"].ingest(url)
+    return web.json_response(_job_status(job), status=200 if job.done else 202)
+
+
+async def handle_status(request):
+    return web.json_response(_job_status(_job_or_404(request, request.query.get("url"))))
+
+
+async def handle_summary(request):
+    # ?wait=1 holds the request until the summary is finished, or for
+    # ?timeout= seconds
+    job = _job_or_404(request, request.query.get("url"))
+    timeout = _timeout(request.query.get("timeout"))
+    if request.query.get("wait") not in (None, "", "0"):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not job.done and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+    return web.json_response(dict(_job_status(job), summary=job.summary_text()))
+
+
+async def handle_ask(request):
+    body = await _read_json(request)
+    question = body.get("question")
+    question = question.strip() if isinstance(question, str) else ""
+    if not question:
+        raise web.HTTPBadRequest(text="Missing question")
+    job = _job_or_404(request, body.get("url"))
+    if job.retriever is None:
+        raise web.HTTPConflict(text=f"{job.url} is still {job.status}; ask once it is indexed")
+
+    timeout = _timeout(body.get("timeout"))
+    try:
+        answer = await request.app["batcher"].submit((question, job.retriever), timeout=timeout)
+    except QueueFull as e:
+        raise web.HTTPServiceUnavailable(text=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout(text=f"No answer within {timeout:.1f}s")
+    return web.json_response({"url": job.url, "question": question, "answer": answer})
+
+
+async def handle_stats(request):
+    return web.json_response({
+        "batcher": request.app["batcher"].report(),
+        "jobs": [_job_status(job) for job in request.app["jobs"].jobs.values()],
+    })
+
+
+async def handle_metrics(request):
+    report = request.app["batcher"].report()
+    lines = []
+    for name, (kind, help_text) in BATCHER_METRICS.items():
+        metric = f"anime_service_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {report[name]}"]
+    return web.Response(text="\n".join(lines) + "\n" + tracing.prometheus_text(), content_type="text/plain")
+
+
+async def handle_health(request):
+    return web.json_response({"ok": True})
+
+
+def create_app(max_batch_size=None, max_wait_ms=None, max_queue=None, use_cache=True, jobs=None):
+    batcher_kwargs = {
+        name: value
+        for name, value in (("max_batch_size", max_batch_size), ("max_wait_ms", max_wait_ms), ("max_queue", max_queue))
+        if value is not None
+    }
+    app = web.Application()
+    app["jobs"] = jobs or JobStore()
+    app["batcher"] = MicroBatcher(lambda items: answer_batch(items, use_cache=use_cache), **batcher_kwargs)
+
+    async def start_batcher(app):
+        app["batcher"].start()
+
+    async def stop_batcher(app):
+        await app["batcher"].stop()
+
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    app.add_routes([
+        web.post("/ingest", handle_ingest),
+        web.get("/status", handle_status),
+        web.get("/summary", handle_summary),
+        web.post("/ask", handle_ask),
+        web.get("/stats", handle_stats),
+        web.get("/metrics", handle_metrics),
+        web.get("/health", handle_health),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless HTTP API: ingest a Fandom URL, read its summary, ask questions.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=None)
+    parser.add_argument("--max-wait-ms", type=float, default=None)
+    parser.add_argument("--max-queue", type=int, default=None)
+    args = parser.parse_args()
+
+    warm_up()
+    web.run_app(
+        create_app(args.max_batch_size, args.max_wait_ms, args.max_queue),
+        host=args.host,
+        port=args.port,
+    )
@@ -1,15 +1,28 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from sklearn.cluster import KMeans
 from typing import List
 
-model_name = "facebook/bart-large-cnn"
+from embeddings import EmbeddedChunks, embed_chunks
+from models import SUMMARIZER_MODEL, get_summarizer, get_tokenizer, in_use
+from tracing import span
+
+model_name = SUMMARIZER_MODEL
 
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# "cluster" summarizes the first chunk's cluster; "map_reduce" covers the whole page
+SUMMARY_MODE = os.environ.get("ANIME_SUMMARY_MODE", "cluster")
+# Total bart input tokens spent on the map stage; bounds long-page latency
+TOKEN_BUDGET = 4000
+MAP_INPUT_TOKENS = 900
+MAP_SUMMARY_LENGTH = (120, 30)
+MAP_BATCH_SIZE = 4
+SUMMARY_WORKERS = int(os.environ.get("ANIME_SUMMARY_WORKERS", "1"))
 
-summarizer = pipeline("summarization", model=model, tokenizer=tokenizer)
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+_pool = None
+_pool_lock = threading.Lock()
 
 def dynamic_summary_length(text, scale=0.5, max_cap=300):
     word_count = len(text.split())
@@ -17,16 +30,133 @@ def dynamic_summary_length(text, scale=0.5, max_cap=300):
     min_length = max(int(max_length * 0.5), 20)
     return max_length, min_length
 
-def summarize_chunks(chunks: List[dict], num_clusters: int = 5):
-    texts = [chunk["text"] for chunk in chunks if len(chunk["text"].strip()) > 50]
-    if not texts:
+def _token_lengths(texts, tokenizer):
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']]
+
+def _clip_tokens(text, tokenizer, max_tokens):
+    # Cut at the last kept token's character offset; no decode round trip
+    encoding = tokenizer(text, add_special_tokens=False, truncation=True, max_length=max_tokens, return_offsets_mapping=True)
+    offsets = encoding['offset_mapping']
+    return text[:offsets[-1][1]] if offsets else ""
+
+def representative_groups(texts, embeddings, num_clusters, lengths, token_budget):
+    # A single k-means++ start is plenty for picking representatives. Each cluster
+    # contributes the chunks nearest its centroid, up to its share of the budget.
+    k = min(num_clusters, len(texts))
+    with span("kmeans", clusters=k, chunks=len(texts), n_init=1):
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=1)
+        labels = kmeans.fit_predict(embeddings)
+    distances = kmeans.transform(embeddings)[np.arange(len(texts)), labels]
+    per_group = max(1, min(MAP_INPUT_TOKENS, token_budget // k))
+
+    groups = []
+    for cluster in range(k):
+        members = np.where(labels == cluster)[0]
+        chosen, used = [], 0
+        for i in members[np.argsort(distances[members])]:
+            if chosen and used + lengths[i] > per_group:
+                continue
+            chosen.append(int(i))
+            used += lengths[i]
+            if used >= per_group:
+                break
+        if chosen:
+            groups.append(sorted(chosen))
+
+    # Keep the page's narrative order, across and within groups
+    groups.sort(key=lambda group: group[0])
+    return [" ".join(texts[i] for i in group) for group in groups], per_group
+
+def _summarize_batch(texts, max_length, min_length, batch_size=MAP_BATCH_SIZE, streamer=None):
+    with span("summarize", inputs=len(texts), batch_size=batch_size, max_length=max_length), in_use(SUMMARIZER_MODEL):
+        results = get_summarizer()(
+            texts,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            truncation=True,
+            batch_size=batch_size,
+            streamer=streamer,
+        )
+    return [result['summary_text'] for result in results]
+
+def _get_pool(workers):
+    # Worker processes each load bart once through the registry and are reused
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+def _map_summaries(texts, workers):
+    max_length, min_length = MAP_SUMMARY_LENGTH
+    if workers <= 1 or len(texts) <= 1:
+        return _summarize_batch(texts, max_length, min_length)
+
+    size = -(-len(texts) // workers)
+    slices = [texts[i:i + size] for i in range(0, len(texts), size)]
+    pool = _get_pool(workers)
+    futures = [pool.submit(_summarize_batch, part, max_length, min_length) for part in slices]
+    return [summary for future in futures for summary in future.result()]
+
+def map_reduce_summary(texts, embeddings, num_clusters=5, token_budget=TOKEN_BUDGET, workers=SUMMARY_WORKERS, streamer=None):
+    tokenizer = get_tokenizer(SUMMARIZER_MODEL)
+    groups, per_group = representative_groups(texts, embeddings, num_clusters, _token_lengths(texts, tokenizer), token_budget)
+    partials = _map_summaries([_clip_tokens(group, tokenizer, per_group) for group in groups], workers)
+
+    # Reduce: merge partial summaries into inputs that fit one bart call, until one remains
+    while True:
+        lengths = _token_lengths(partials, tokenizer)
+        if sum(lengths) <= MAP_INPUT_TOKENS or len(partials) == 1:
+            break
+        windows, current, used = [], [], 0
+        for partial, length in zip(partials, lengths):
+            if current and used + length > MAP_INPUT_TOKENS:
+                windows.append(" ".join(current))
+                current, used = [], 0
+            current.append(partial)
+            used += length
+        windows.append(" ".join(current))
+        if len(windows) == len(partials):
+            break
+        partials = _map_summaries(windows, workers)
+
+    combined = _clip_tokens(" ".join(partials), tokenizer, MAP_INPUT_TOKENS)
+    max_len, min_len = dynamic_summary_length(combined, scale=0.6, max_cap=350)
+    # Only the final reduce step is streamed; the map steps feed it
+    return _summarize_batch([combined], max_len, min(min_len, max_len), streamer=streamer)[0]
+
+def summarize_chunks(chunks: List[dict], num_clusters: int = 5, mode: str = SUMMARY_MODE,
+                     token_budget: int = TOKEN_BUDGET, workers: int = SUMMARY_WORKERS, streamer=None):
+    keep = [i for i, chunk in enumerate(chunks) if len(chunk["text"].strip()) > 50]
+    if not keep:
         return "No content available to summarize."
 
-    embeddings = embedder.encode(texts)
+    # Reuse embeddings computed upstream when given an EmbeddedChunks
+    if isinstance(chunks, EmbeddedChunks):
+        embedded = chunks.subset(keep)
+    else:
+        embedded = embed_chunks([chunks[i] for i in keep])
+
+    texts = embedded.texts()
+    embeddings = embedded.embeddings
+
+    if mode == "map_reduce":
+        try:
+            return map_reduce_summary(texts, embeddings, num_clusters=num_clusters, token_budget=token_budget,
+                                      workers=workers, streamer=streamer)
+        except Exception as e:
+            return f"Summarization failed: {e}"
+    if mode != "cluster":
+        raise ValueError(f"Unknown summary mode: {mode}")
+
     first_embedding = embeddings[0]
 
-    kmeans = KMeans(n_clusters=min(num_clusters, len(texts)), random_state=42, n_init=10)
-    labels = kmeans.fit_predict(embeddings)
+    with span("kmeans", clusters=min(num_clusters, len(texts)), chunks=len(texts), n_init=10):
+        kmeans = KMeans(n_clusters=min(num_clusters, len(texts)), random_state=42, n_init=10)
+        labels = kmeans.fit_predict(embeddings)
 
     first_label = labels[0]
 
@@ -35,12 +165,14 @@ def summarize_chunks(chunks: List[dict], num_clusters: int = 5):
 
     max_len, min_len = dynamic_summary_length(combined_text, scale=0.6, max_cap=350)
     try:
-        summary = summarizer(
-            combined_text,
-            max_length=max_len,
-            min_length=min_len,
-            do_sample=False
-        )[0]['summary_text']
+        with span("summarize", inputs=1, batch_size=1, max_length=max_len), in_use(SUMMARIZER_MODEL):
+            summary = get_summarizer()(
+                combined_text,
+                max_length=max_len,
+                min_length=min_len,
+                do_sample=False,
+                streamer=streamer,
+            )[0]['summary_text']
         return summary
     except Exception as e:
         return f"Summarization failed: {e}"
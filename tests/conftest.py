@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modules read their cache locations at import time, so point every on-disk
+# cache at a scratch directory before any of them is imported
+os.environ["ANIME_CACHE_DIR"] = tempfile.mkdtemp(prefix="anime-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher, QueueFull
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_full_batch_is_sent_without_waiting():
+    batches = []
+
+    def handler(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(handler, max_batch_size=4, max_wait_ms=10_000).start()
+        try:
+            start = time.monotonic()
+            results = await asyncio.gather(*(batcher.submit(i) for i in range(8)))
+            return results, time.monotonic() - start, batcher.report()
+        finally:
+            await batcher.stop()
+
+    results, elapsed, report = run(main())
+    assert results == [i * 2 for i in range(8)]
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    # Full batches close at once, long before max_wait_ms
+    assert elapsed < 5
+    assert (report["batches"], report["batched_items"], report["mean_batch_size"]) == (2, 8, 4.0)
+
+
+def test_partial_batch_is_sent_after_max_wait():
+    batches = []
+
+    def handler(items):
+        batches.append(list(items))
+        return items
+
+    async def main():
+        batcher = MicroBatcher(handler, max_batch_size=16, max_wait_ms=50).start()
+        try:
+            first = asyncio.ensure_future(batcher.submit("a"))
+            await asyncio.sleep(0.01)
+            second = asyncio.ensure_future(batcher.submit("b"))
+            await asyncio.gather(first, second)
+            await asyncio.sleep(0.1)
+            await batcher.submit("c")
+        finally:
+            await batcher.stop()
+
+    run(main())
+    # a and b arrived within max_wait of each other; c came after that batch closed
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_timeout_and_full_queue():
+    release = threading.Event()
+
+    def handler(items):
+        release.wait(5)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(handler, max_batch_size=1, max_wait_ms=0, max_queue=1).start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                # Taken by the worker, which is now blocked
+                await batcher.submit("slow", timeout=0.05)
+            queued = asyncio.ensure_future(batcher.submit("queued"))
+            await asyncio.sleep(0.01)
+            with pytest.raises(QueueFull):
+                await batcher.submit("rejected")
+            release.set()
+            assert await queued == "queued"
+            return batcher.report()
+        finally:
+            release.set()
+            await batcher.stop()
+
+    report = run(main())
+    assert (report["timeouts"], report["rejected"], report["requests"]) == (1, 1, 2)
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import bulk_qa  # noqa: E402
+
+
+def write_input(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rerun_retries_only_errors(tmp_path, monkeypatch):
+    input_path, output_path = str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")
+    write_input(input_path, [
+        {"id": str(i), "question": f"question {i}", "context": f"context {i}", "answer": f"answer {i}"}
+        for i in range(4)
+    ])
+    failing = {"1"}
+    asked = []
+
+    def fake_ask(questions, retriever, batch_size=8, hits=None):
+        asked.extend(questions)
+        return ["Error: model crashed" if q.split()[-1] in failing else f"answer {q.split()[-1]}" for q in questions]
+
+    monkeypatch.setattr(bulk_qa, "raw_ask_questions", fake_ask)
+    totals = bulk_qa.run(input_path, output_path, use_context=True, batch_size=2, score=True)
+    assert (totals["answered"], totals["skipped"]) == (4, 0)
+    # A torn line from an interrupted write is dropped on resume
+    with open(output_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "3", "answ')
+
+    failing.clear()
+    asked.clear()
+    totals = bulk_qa.run(input_path, output_path, use_context=True, batch_size=2, score=True)
+    assert (totals["answered"], totals["skipped"]) == (1, 3)
+    assert asked == ["question 1"]
+
+    records = read_output(output_path)
+    assert [r["id"] for r in records] == ["0", "1", "2", "3", "1"]
+    assert "error" in records[1] and "error" not in records[4]
+    assert records[4]["exact_match"] is True
+    assert bulk_qa.ResultWriter(output_path).done == {"0", "1", "2", "3"}
@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+from scraping.chunking import split_chunk
+
+
+def subword_tokenizer(text, add_special_tokens=False, return_offsets_mapping=False):
+    # Splits words into pieces of up to three characters, so windows can
+    # land in the middle of a word the way real subword tokenizers do
+    offsets = [(m.start(), m.end()) for m in re.finditer(r"\S{1,3}", text)]
+    return {"input_ids": list(range(len(offsets))), "offset_mapping": offsets}
+
+
+TEXT = " ".join(f"word{i}" + "x" * (i % 5) for i in range(200))
+
+
+def test_short_chunk_is_one_window():
+    chunk = {"section": "Background", "text": "Naruto is a ninja."}
+    (window,) = split_chunk(chunk, subword_tokenizer, max_tokens=16, overlap=4)
+    assert window["text"] == chunk["text"]
+    assert (window["window"], window["start"], window["end"]) == (0, 0, len(chunk["text"]))
+    assert window["section"] == "Background"
+
+
+def test_windows_respect_bounds_and_cover_text():
+    windows = split_chunk({"text": TEXT}, subword_tokenizer, max_tokens=24, overlap=6)
+    assert len(windows) > 1
+    assert [w["window"] for w in windows] == list(range(len(windows)))
+    assert windows[0]["start"] == 0
+    assert windows[-1]["end"] == len(TEXT)
+    for w in windows:
+        assert 0 < w["token_count"] <= 24
+        assert w["token_count"] == len(w["token_ids"])
+        assert w["text"] == TEXT[w["start"]:w["end"]]
+        # Windows begin and end on word boundaries
+        assert w["start"] == 0 or TEXT[w["start"] - 1] == " "
+        assert w["end"] == len(TEXT) or TEXT[w["end"]] == " "
+    for previous, current in zip(windows, windows[1:]):
+        # Consecutive windows overlap without gaps and always move forward
+        assert previous["start"] < current["start"] < previous["end"]
+
+
+def test_overlap_must_be_smaller_than_window():
+    with pytest.raises(ValueError):
+        split_chunk({"text": TEXT}, subword_tokenizer, max_tokens=8, overlap=8)
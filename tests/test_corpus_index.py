@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+import corpus_index
+from corpus_index import CorpusIndex
+from embeddings import EmbeddedChunks
+
+DIM = 16
+
+
+def page(name, count=3):
+    # One orthonormal vector per chunk, so each chunk is its own nearest neighbour
+    chunks = [{"section": name, "text": f"{name} chunk {i}"} for i in range(count)]
+    offset = "ABCD".index(name) * count
+    return EmbeddedChunks(chunks, np.eye(DIM, dtype=np.float32)[offset:offset + count])
+
+
+def vector(name, i, count=3):
+    return np.eye(DIM, dtype=np.float32)["ABCD".index(name) * count + i][None]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    # Compact as soon as any row is dead
+    monkeypatch.setattr(corpus_index, "COMPACT_MIN_DEAD_ROWS", 1)
+    monkeypatch.setattr(corpus_index, "COMPACT_DEAD_FRACTION", 0.0)
+    index = CorpusIndex(str(tmp_path))
+    index.encode_queries = lambda questions: np.concatenate([vector(*q) for q in questions])
+    for name in "ABC":
+        index.add_page(f"https://naruto.fandom.com/wiki/{name}", page(name), title=name)
+    return index
+
+
+def top_text(index, name, i, **kwargs):
+    return index.query((name, i), top_k=1, **kwargs)[0]["text"]
+
+
+def test_add_delete_compact_round_trip(corpus, tmp_path):
+    assert top_text(corpus, "B", 2) == "B chunk 2"
+    old_file = corpus._matrix_path()
+
+    assert corpus.delete_page("https://naruto.fandom.com/wiki/A")
+    # The delete crossed the compaction threshold: dead rows are gone and
+    # the old matrix file was replaced
+    assert corpus.dead_rows() == (0, 6)
+    assert not os.path.exists(old_file)
+    assert top_text(corpus, "B", 2) == "B chunk 2"
+    assert top_text(corpus, "C", 0) == "C chunk 0"
+
+    corpus.add_page("https://naruto.fandom.com/wiki/D", page("D"), title="D")
+    reopened = CorpusIndex(str(tmp_path))
+    reopened.encode_queries = corpus.encode_queries
+    assert [p["title"] for p in reopened.pages()] == ["B", "C", "D"]
+    assert top_text(reopened, "D", 1) == "D chunk 1"
+    assert top_text(reopened, "C", 1, urls=["https://naruto.fandom.com/wiki/C"]) == "C chunk 1"
+
+
+def test_rows_from_a_compacted_snapshot_are_not_resolved(corpus):
+    snapshot = corpus._snapshot()
+    _, rows = corpus.search(vector("B", 2), top_k=1, snapshot=snapshot)
+    assert corpus.chunks_for_rows(rows[0], snapshot)[int(rows[0][0])]["text"] == "B chunk 2"
+
+    corpus.delete_page("https://naruto.fandom.com/wiki/A")
+    # Row 5 now holds C chunk 2; the stale snapshot must not map onto it
+    assert corpus.chunks_for_rows(rows[0], snapshot) is None
+
+
+def test_query_searches_again_after_a_concurrent_compaction(corpus):
+    search = corpus.search
+    calls = []
+
+    def search_then_compact(*args, **kwargs):
+        result = search(*args, **kwargs)
+        if not calls:
+            corpus.delete_page("https://naruto.fandom.com/wiki/A")
+        calls.append(kwargs["snapshot"].matrix_file)
+        return result
+
+    corpus.search = search_then_compact
+    assert top_text(corpus, "B", 2) == "B chunk 2"
+    assert len(calls) == 2 and calls[0] != calls[1]
+
+
+def test_retriever_fingerprint_follows_selected_pages(corpus):
+    retriever = corpus.retriever(urls=["https://naruto.fandom.com/wiki/B"])
+    before = retriever.fingerprint
+    corpus.add_page("https://naruto.fandom.com/wiki/D", page("D"), title="D")
+    assert retriever.fingerprint == before
+    corpus.add_page("https://naruto.fandom.com/wiki/B", page("D"), title="B")
+    assert retriever.fingerprint != before
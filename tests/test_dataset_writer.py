@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "questioning", "questions creation"))
+
+from dataset_writer import QADatasetWriter, chunk_hash  # noqa: E402
+
+CHUNKS = [{"section": "Background", "text": f"Naruto fact {i}."} for i in range(3)]
+
+
+def pairs(chunk):
+    return [{"question": f"Q{n} about {chunk['text']}", "answer": "A", "section": chunk["section"], "context": chunk["text"]}
+            for n in range(2)]
+
+
+def test_resume_skips_checkpointed_chunks(tmp_path):
+    path = str(tmp_path / "qa.jsonl")
+    with QADatasetWriter(path, flush_every=1) as writer:
+        writer.write(CHUNKS[0], pairs(CHUNKS[0]))
+        writer.write(CHUNKS[1], [])
+
+    writer = QADatasetWriter(path)
+    assert writer.pending(CHUNKS) == [CHUNKS[2]]
+    assert len(list(writer.iter_rows())) == 2
+
+
+def test_torn_tail_is_dropped_before_appending(tmp_path):
+    path = str(tmp_path / "qa.jsonl")
+    with QADatasetWriter(path, flush_every=1) as writer:
+        writer.write(CHUNKS[0], pairs(CHUNKS[0]))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"question": "cut sho')
+    with open(f"{path}.checkpoint", "a", encoding="utf-8") as f:
+        f.write(chunk_hash(CHUNKS[1])[:10])
+
+    with QADatasetWriter(path, flush_every=1) as writer:
+        assert writer.pending(CHUNKS) == CHUNKS[1:]
+        writer.write(CHUNKS[1], pairs(CHUNKS[1]))
+
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["chunk_hash"] for row in rows] == [chunk_hash(CHUNKS[0])] * 2 + [chunk_hash(CHUNKS[1])] * 2
+
+
+def test_rows_without_checkpoint_are_regenerated(tmp_path):
+    # A crash between the data fsync and the checkpoint write leaves rows
+    # whose chunk is not done; they are dropped so the chunk is redone whole
+    path = str(tmp_path / "qa.jsonl")
+    with QADatasetWriter(path, flush_every=1) as writer:
+        writer.write(CHUNKS[0], pairs(CHUNKS[0]))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(dict(pairs(CHUNKS[1])[0], chunk_hash=chunk_hash(CHUNKS[1]))) + "\n")
+
+    writer = QADatasetWriter(path)
+    assert writer.pending(CHUNKS) == CHUNKS[1:]
+    assert [row["chunk_hash"] for row in writer.iter_rows()] == [chunk_hash(CHUNKS[0])] * 2
@@ -0,0 +1,122 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scraping import final_scraper
+from scraping.fetcher import PageCache, create_session, fetch_page
+
+PAGE = (
+    '<html><body><h1>Naruto Uzumaki</h1><div class="mw-parser-output">'
+    '<h2><span class="mw-headline">Background</span></h2><p>Naruto is a ninja.</p>'
+    '</div></body></html>'
+)
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class FandomStandIn(BaseHTTPRequestHandler):
+    # Serves PAGE with validators, answers 304 to a matching conditional GET,
+    # and fails the first `failures` requests with 503
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.failures:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = server.body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FandomStandIn)
+    httpd.requests = []
+    httpd.failures = 0
+    httpd.body = PAGE
+    httpd.etag = ETAG
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/wiki/Naruto_Uzumaki"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def session():
+    return create_session(backoff_factor=0)
+
+
+def test_second_fetch_is_conditional_and_304_reuses_cached_html(server, session, tmp_path, monkeypatch):
+    monkeypatch.setattr("scraping.fetcher.get_page_cache", lambda: PageCache(str(tmp_path)))
+
+    first = fetch_page(server.url, session=session)
+    second = fetch_page(server.url, session=session)
+
+    assert "If-None-Match" not in server.requests[0]
+    assert server.requests[1]["If-None-Match"] == ETAG
+    assert server.requests[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert not first["from_cache"]
+    assert second["from_cache"]
+    assert second["html"] == PAGE
+    assert second["content_hash"] == first["content_hash"]
+
+
+def test_fetch_without_cache_sends_no_validators(server, session):
+    fetch_page(server.url, session=session, use_cache=False)
+    fetch_page(server.url, session=session, use_cache=False)
+    assert all("If-None-Match" not in headers for headers in server.requests)
+
+
+def test_retries_transient_server_errors(server, session):
+    server.failures = 2
+    page = fetch_page(server.url, session=session, use_cache=False)
+    assert page["html"] == PAGE
+    assert len(server.requests) == 3
+
+
+def test_gives_up_after_max_retries(server):
+    server.failures = 10
+    with pytest.raises(Exception):
+        fetch_page(server.url, session=create_session(retries=1, backoff_factor=0), use_cache=False)
+    assert len(server.requests) == 2
+
+
+def test_unchanged_content_skips_parsing(server, session, tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path))
+    monkeypatch.setattr("scraping.fetcher.get_page_cache", lambda: cache)
+    monkeypatch.setattr(final_scraper, "get_page_cache", lambda: cache)
+    parses = []
+    parse = final_scraper.parse_fandom_html
+    monkeypatch.setattr(final_scraper, "parse_fandom_html", lambda html, url: parses.append(url) or parse(html, url))
+
+    first = final_scraper.scrape_fandom_page(server.url, session=session)
+    second = final_scraper.scrape_fandom_page(server.url, session=session)
+    assert len(parses) == 1
+    assert second["chunks"] == first["chunks"] == [
+        {"section": "Background", "parent_section": None, "text": "Naruto is a ninja."}
+    ]
+
+    # Edited content is fetched and parsed again
+    server.body = PAGE.replace("a ninja", "the Seventh Hokage")
+    server.etag = '"v2"'
+    third = final_scraper.scrape_fandom_page(server.url, session=session)
+    assert len(parses) == 2
+    assert third["chunks"][0]["text"] == "Naruto is the Seventh Hokage."
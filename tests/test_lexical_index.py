@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+
+from lexical_index import BM25Index
+
+
+def test_scores_match_hand_computed_bm25():
+    # k1 = 1.5, b = 0.75, average length 2
+    index = BM25Index(["Naruto ninja", "Sasuke ninja ninja", "Sakura"])
+    idf_ninja = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    idf_naruto = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    # doc 0: length 2, so the length norm is k1 * (1 - b + b * 2 / 2) = 1.5
+    doc0 = idf_ninja * 1 * 2.5 / (1 + 1.5) + idf_naruto * 1 * 2.5 / (1 + 1.5)
+    # doc 1: length 3, norm 1.5 * (0.25 + 0.75 * 3 / 2) = 2.0625, tf 2
+    doc1 = idf_ninja * 2 * 2.5 / (2 + 2.0625)
+
+    ids, scores = index.scores("ninja NARUTO?")
+    assert ids.tolist() == [0, 1]
+    np.testing.assert_allclose(scores, [doc0, doc1], rtol=1e-6)
+
+    scores, ids = index.search("ninja naruto", top_k=1)
+    assert ids.tolist() == [0]
+    np.testing.assert_allclose(scores, [doc0], rtol=1e-6)
+
+
+def test_query_without_known_terms_matches_nothing():
+    index = BM25Index(["Naruto ninja", "Sakura"])
+    scores, ids = index.search("Kakashi", top_k=3)
+    assert len(scores) == len(ids) == 0
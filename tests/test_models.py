@@ -0,0 +1,57 @@
+import sys
+import types
+
+import pytest
+
+import models
+import tracing
+
+
+@pytest.fixture
+def fake_transformers(monkeypatch):
+    # Stands in for transformers so get_tokenizer loads without downloading
+    loads = []
+
+    class AutoTokenizer:
+        @staticmethod
+        def from_pretrained(name):
+            loads.append(name)
+            return types.SimpleNamespace(name_or_path=name)
+
+    monkeypatch.setitem(sys.modules, "transformers", types.SimpleNamespace(AutoTokenizer=AutoTokenizer))
+    yield loads
+    for name in set(loads):
+        models.unload(name)
+
+
+def test_get_tokenizer_loads_once_with_tracing_off(fake_transformers):
+    tracing.disable()
+    first = models.get_tokenizer("smoke/tracing-off")
+    second = models.get_tokenizer("smoke/tracing-off")
+    assert first is second
+    assert fake_transformers == ["smoke/tracing-off"]
+    assert ("tokenizer", "smoke/tracing-off") in models.loaded_models()
+
+
+def test_get_tokenizer_records_model_load_span(fake_transformers):
+    tracing.enable()
+    try:
+        tracing.clear()
+        models.get_tokenizer("smoke/tracing-on")
+        models.get_tokenizer("smoke/tracing-on")
+        spans = [s for s in tracing.recent_spans() if s["name"] == "model_load"]
+    finally:
+        tracing.disable()
+    assert len(spans) == 1
+    assert (spans[0]["kind"], spans[0]["model"]) == ("tokenizer", "smoke/tracing-on")
+
+
+def test_unload_skips_busy_models_and_next_get_reloads(fake_transformers):
+    first = models.get_tokenizer("smoke/unload")
+    with models.in_use("smoke/unload"):
+        assert models.unload("smoke/unload") == 0
+        assert models.model_usage()["smoke/unload"]["busy"]
+    assert models.unload("smoke/unload") == 1
+    assert ("tokenizer", "smoke/unload") not in models.loaded_models()
+    assert models.get_tokenizer("smoke/unload") is not first
+    assert fake_transformers == ["smoke/unload", "smoke/unload"]
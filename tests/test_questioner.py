@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from questioning.final_questioner import MAX_INPUT_TOKENS, PROMPT_PREFIX, build_prompt_ids
+
+
+class WordTokenizer:
+    # One id per whitespace-separated word; enough to count prompt tokens
+    name_or_path = "word-tokenizer"
+    eos_token_id = 1
+
+    def __call__(self, text, add_special_tokens=False):
+        if isinstance(text, list):
+            return {"input_ids": [self(t)["input_ids"] for t in text]}
+        return {"input_ids": [2 + len(word) for word in text.split()]}
+
+
+def test_long_question_keeps_prompt_within_limit():
+    tokenizer = WordTokenizer()
+    hits = [({"section": "Background", "text": "ninja " * 600}, 1.0)]
+    question = "why " * 2000
+
+    input_ids, _ = build_prompt_ids(question, hits, tokenizer)
+
+    assert len(input_ids) <= MAX_INPUT_TOKENS
+    # The context is not squeezed out, and the prompt still ends in "Answer:"
+    assert input_ids[:len(PROMPT_PREFIX.split())] == tokenizer(PROMPT_PREFIX)["input_ids"]
+    assert input_ids.count(2 + len("ninja")) > 100
+    assert input_ids[-2:] == tokenizer("Answer:")["input_ids"] + [tokenizer.eos_token_id]
+
+
+def test_short_question_is_kept_whole():
+    tokenizer = WordTokenizer()
+    hits = [({"section": "Background", "text": "ninja " * 600}, 1.0)]
+
+    input_ids, _ = build_prompt_ids("who is naruto", hits, tokenizer)
+
+    assert len(input_ids) == MAX_INPUT_TOKENS
+    assert input_ids[-6:] == tokenizer("Question: who is naruto Answer:")["input_ids"] + [1]
@@ -0,0 +1,243 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_ENV = "ANIME_TRACE"
+TRACE_FILE_ENV = "ANIME_TRACE_FILE"
+MAX_SPANS = 2000
+
+_enabled = os.environ.get(TRACE_ENV, "0").lower() not in ("", "0", "false", "no")
+_jsonl_path = os.environ.get(TRACE_FILE_ENV)
+_spans = deque(maxlen=MAX_SPANS)
+# Cumulative per-name totals since process start; unlike _spans these never
+# drop or reset, so they can back Prometheus counters
+_totals = {}
+_lock = threading.Lock()
+_local = threading.local()
+_next_id = 0
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process, or None if the platform cannot tell
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def current_rss_mb():
+    # Resident set size right now, or None if the platform cannot tell
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+# Fields every span has; anything else in to_dict() is a caller attribute
+SPAN_FIELDS = ("id", "parent", "name", "start", "wall_seconds", "cpu_seconds", "rss_start_mb", "rss_end_mb",
+               "rss_delta_mb", "thread")
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "attrs", "start", "wall_seconds", "cpu_seconds", "rss_start_mb",
+                 "rss_end_mb", "thread")
+
+    def __init__(self, span_id, parent, name, attrs):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.thread = threading.current_thread().name
+
+    @property
+    def rss_delta_mb(self):
+        # Memory the stage left resident, e.g. model weights or an index
+        if self.rss_start_mb is None or self.rss_end_mb is None:
+            return None
+        return self.rss_end_mb - self.rss_start_mb
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": self.start,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rss_start_mb": self.rss_start_mb,
+            "rss_end_mb": self.rss_end_mb,
+            "rss_delta_mb": self.rss_delta_mb,
+            "thread": self.thread,
+            **self.attrs,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def enable(jsonl_path=None):
+    global _enabled, _jsonl_path
+    _enabled = True
+    if jsonl_path:
+        _jsonl_path = jsonl_path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextmanager
+def span(name, **attrs):
+    # Near-free when tracing is off: one flag check and a shared no-op span
+    if not _enabled:
+        yield _NOOP
+        return
+
+    global _next_id
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    with _lock:
+        _next_id += 1
+        current = Span(_next_id, stack[-1].id if stack else None, name, attrs)
+
+    stack.append(current)
+    current.rss_start_mb = current_rss_mb()
+    wall_start = time.perf_counter()
+    # Process CPU time, so work done by torch's intra-op threads is included
+    cpu_start = time.process_time()
+    try:
+        yield current
+    except Exception as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.wall_seconds = time.perf_counter() - wall_start
+        current.cpu_seconds = time.process_time() - cpu_start
+        current.rss_end_mb = current_rss_mb()
+        stack.pop()
+        _record(current)
+
+
+def _add(entry, s):
+    # s: a span dict; numeric attributes (token counts, batch sizes, ...) are summed
+    entry["count"] += 1
+    entry["wall_seconds"] += s["wall_seconds"] or 0.0
+    entry["cpu_seconds"] += s["cpu_seconds"] or 0.0
+    if s["rss_end_mb"] is not None:
+        entry["rss_end_mb"] = s["rss_end_mb"]
+        entry["max_rss_mb"] = max(entry["max_rss_mb"], s["rss_end_mb"])
+    if s["rss_delta_mb"] is not None:
+        entry["rss_delta_mb"] += s["rss_delta_mb"]
+        entry["max_rss_delta_mb"] = max(entry["max_rss_delta_mb"], s["rss_delta_mb"])
+    for key, value in s.items():
+        if key not in SPAN_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            entry["attrs"][key] = entry["attrs"].get(key, 0) + value
+
+
+def _new_entry():
+    return {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rss_end_mb": 0.0, "max_rss_mb": 0.0,
+            "rss_delta_mb": 0.0, "max_rss_delta_mb": 0.0, "attrs": {}}
+
+
+def _record(finished):
+    record = finished.to_dict()
+    with _lock:
+        _spans.append(finished)
+        _add(_totals.setdefault(finished.name, _new_entry()), record)
+        if _jsonl_path:
+            with open(_jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def recent_spans(limit=None):
+    with _lock:
+        spans = list(_spans)
+    spans = spans[-limit:] if limit else spans
+    return [s.to_dict() for s in spans]
+
+
+def clear():
+    # Drops the recent spans only; cumulative totals keep counting
+    with _lock:
+        _spans.clear()
+
+
+def summary():
+    # Per-span-name totals over the recent spans
+    totals = {}
+    for s in recent_spans():
+        _add(totals.setdefault(s["name"], _new_entry()), s)
+    return totals
+
+
+def cumulative_totals():
+    # Per-span-name totals over every span since the process started
+    with _lock:
+        return {name: dict(entry, attrs=dict(entry["attrs"])) for name, entry in _totals.items()}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    # Counters come from the cumulative totals, so they only ever go up;
+    # memory is exported as gauges
+    totals = cumulative_totals()
+    metrics = [
+        ("anime_span_count", "counter", "Number of finished spans.", lambda t: t["count"]),
+        ("anime_span_seconds_total", "counter", "Wall-clock seconds spent in spans.",
+         lambda t: f'{t["wall_seconds"]:.6f}'),
+        ("anime_span_cpu_seconds_total", "counter", "Process CPU seconds spent in spans.",
+         lambda t: f'{t["cpu_seconds"]:.6f}'),
+        ("anime_span_rss_megabytes", "gauge", "Process RSS at the end of the latest span.",
+         lambda t: f'{t["rss_end_mb"]:.1f}'),
+        ("anime_span_max_rss_delta_megabytes", "gauge", "Largest RSS growth within a single span.",
+         lambda t: f'{t["max_rss_delta_mb"]:.1f}'),
+    ]
+    lines = []
+    for metric, kind, help_text, value in metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{span="{_label(n)}"}} {value(t)}' for n, t in totals.items()]
+    lines += ["# HELP anime_span_attr_total Summed numeric span attributes such as token counts.", "# TYPE anime_span_attr_total counter"]
+    for n, t in totals.items():
+        lines += [f'anime_span_attr_total{{span="{_label(n)}",attr="{_label(k)}"}} {v}' for k, v in t["attrs"].items()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,167 @@
+import json
+import math
+import os
+
+import numpy as np
+
+# Rows scored per block when the matrix is stored as float16
+SCORE_BLOCK_ROWS = 65536
+
+
+def normalize_rows(matrix, dtype=np.float32) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=dtype)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int):
+    # Partial selection per row, then a sort of only the k survivors
+    n = scores.shape[1]
+    k = min(top_k, n)
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+
+    if k < n:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(n), scores.shape).copy()
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class NumpyIndex:
+    # Exact cosine search over a contiguous, pre-normalized embedding matrix
+    def __init__(self, embeddings, dtype=np.float32):
+        self.matrix = normalize_rows(embeddings, dtype=dtype)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self):
+        # A memory-mapped matrix (a reloaded spill) lives in the page cache,
+        # which the OS reclaims on its own, so it does not count as resident
+        return 0 if isinstance(self.matrix, np.memmap) else self.matrix.nbytes
+
+    def scores(self, queries) -> np.ndarray:
+        queries = normalize_rows(queries)
+        if self.matrix.dtype == np.float32:
+            return queries @ self.matrix.T
+        # float16 halves memory; upcast block by block so BLAS does the work
+        blocks = [
+            queries @ self.matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32).T
+            for start in range(0, len(self), SCORE_BLOCK_ROWS)
+        ]
+        return np.concatenate(blocks, axis=1) if blocks else np.zeros((len(queries), 0), dtype=np.float32)
+
+    def search(self, queries, top_k: int):
+        return top_k_rows(self.scores(queries), top_k)
+
+    def vectors(self, ids):
+        return np.asarray(self.matrix[ids], dtype=np.float32)
+
+    def save(self, path):
+        np.save(os.path.join(path, "matrix.npy"), self.matrix)
+
+    @classmethod
+    def load(cls, path, meta):
+        # Memory-mapped: pages are read back only as searches touch them
+        index = cls.__new__(cls)
+        index.matrix = np.load(os.path.join(path, "matrix.npy"), mmap_mode="r")
+        return index
+
+
+class FaissIndex:
+    # Inner product over normalized vectors, i.e. cosine similarity
+    def __init__(self, embeddings, kind: str = "flat", nlist: int = None, nprobe: int = 8, hnsw_m: int = 32):
+        try:
+            import faiss
+        except ImportError as e:
+            raise ImportError("The FAISS index backend needs faiss-cpu installed.") from e
+
+        matrix = normalize_rows(embeddings)
+        n, dim = matrix.shape
+        if kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        elif kind == "ivf":
+            nlist = max(1, min(nlist or int(4 * math.sqrt(n)), n))
+            self.quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(self.quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            if n:
+                index.train(matrix)
+            index.nprobe = min(nprobe, nlist)
+        elif kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        else:
+            raise ValueError(f"Unknown FAISS index kind: {kind}")
+
+        if n:
+            index.add(matrix)
+        if kind == "ivf":
+            # Lets vectors() reconstruct rows for reranking
+            index.make_direct_map()
+        self.kind = kind
+        self.index = index
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @property
+    def nbytes(self):
+        return self.index.ntotal * self.index.d * 4
+
+    def search(self, queries, top_k: int):
+        queries = normalize_rows(queries)
+        k = min(top_k, len(self))
+        if k <= 0:
+            return top_k_rows(np.zeros((len(queries), 0), dtype=np.float32), top_k)
+        # Approximate indexes pad missing results with -1
+        return self.index.search(queries, k)
+
+    def vectors(self, ids):
+        return self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+    def save(self, path):
+        import faiss
+        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+
+    @classmethod
+    def load(cls, path, meta):
+        import faiss
+        index = cls.__new__(cls)
+        index.kind = meta["kind"]
+        index.index = faiss.read_index(os.path.join(path, "index.faiss"))
+        return index
+
+
+INDEX_BACKENDS = {
+    "numpy": lambda embeddings, **kwargs: NumpyIndex(embeddings, **kwargs),
+    "numpy-fp16": lambda embeddings, **kwargs: NumpyIndex(embeddings, dtype=np.float16, **kwargs),
+    "faiss": lambda embeddings, **kwargs: FaissIndex(embeddings, kind="flat", **kwargs),
+    "faiss-ivf": lambda embeddings, **kwargs: FaissIndex(embeddings, kind="ivf", **kwargs),
+    "faiss-hnsw": lambda embeddings, **kwargs: FaissIndex(embeddings, kind="hnsw", **kwargs),
+}
+
+
+def build_index(embeddings, backend: str = "numpy", **kwargs):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose from: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](embeddings, **kwargs)
+
+
+def save_index(index, path):
+    os.makedirs(path, exist_ok=True)
+    index.save(path)
+    meta = {"type": type(index).__name__, "kind": getattr(index, "kind", None)}
+    with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def load_index(path):
+    with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    classes = {cls.__name__: cls for cls in (NumpyIndex, FaissIndex)}
+    return classes[meta["type"]].load(path, meta)